@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
 
+# As leituras assíncronas (api/v1/assincrono.py) e o SSE (api/v1/eventos.py) só
+# liberam o worker entre um pedaço e outro da resposta quando servidos por aqui,
+# ex.: `uvicorn Backend.asgi:application --workers 4`
 application = get_asgi_application()
@@ -45,8 +45,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.instrumentacao.InstrumentacaoMiddleware',
 ]
 
+# Contagem de consultas/tempo por rota (logger "api.metricas" e /api/v1/metricas/)
+API_INSTRUMENTACAO = config('API_INSTRUMENTACAO', default=True, cast=bool)
+
 ROOT_URLCONF = 'Backend.urls'
 
 TEMPLATES = [
@@ -73,12 +77,92 @@ WSGI_APPLICATION = 'Backend.wsgi.application'
 
 AUTH_USER_MODEL = "api.User"
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgres para produção; sem ele, SQLite ajustado para escrita concorrente
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+
+if DB_ENGINE == 'postgres':
+    _postgres = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': config('DB_NAME', default='sorteio'),
+        'USER': config('DB_USER', default='postgres'),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default='localhost'),
+        'PORT': config('DB_PORT', default='5432'),
+        # conexões persistentes entre requisições (ignorado quando DB_POOL está ligado)
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
-}
+    if config('DB_POOL', default=False, cast=bool):
+        # pool do psycopg 3 dentro de cada processo
+        _postgres['CONN_MAX_AGE'] = 0
+        _postgres['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=10, cast=int),
+        }
+    DATABASES = {'default': _postgres}
+    # réplicas de leitura: DB_REPLICA_HOSTS=host1,host2 (mesmo banco/usuário do principal)
+    for _indice, _host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv())):
+        DATABASES[f'replica_{_indice}'] = {
+            **_postgres,
+            'HOST': _host,
+            'OPTIONS': dict(_postgres['OPTIONS']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                # segundos esperando o lock de escrita antes de "database is locked" (busy_timeout)
+                'timeout': config('DB_SQLITE_TIMEOUT', default=20, cast=int),
+                # BEGIN IMMEDIATE: a compra pega o lock de escrita no início da transação,
+                # em vez de falhar ao tentar promover uma leitura no meio dela
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            },
+        }
+    }
+
+# Leituras de SorteioViewSet (list/retrieve) vão para as réplicas, se houver
+DATABASE_ROUTERS = ['api.roteamento.RoteadorDeReplicas']
+
+
+# Cache compartilhado entre os workers (Redis quando REDIS_URL estiver definido)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Intervalo máximo para um worker perceber mudanças na SiteConfig
+SITECONFIG_CACHE_SEGUNDOS = config('SITECONFIG_CACHE_SEGUNDOS', default=5, cast=int)
+
+# Respostas públicas de sorteio (lista/detalhe) em cache, versionadas por sorteio.
+# Só liga com um cache compartilhado entre processos (Redis): com o locmem as
+# versões incrementadas pelo worker da fila não chegariam aos processos web
+SORTEIO_CACHE_ALIAS = config('SORTEIO_CACHE_ALIAS', default='default')
+SORTEIO_CACHE_SEGUNDOS = config('SORTEIO_CACHE_SEGUNDOS', default=300, cast=int)
+
+# Deltas de disponibilidade por SSE (/api/v1/sorteios/<id>/eventos/), agrupados por janela;
+# com Redis, as mensagens chegam aos clientes de todos os workers. Sem Redis o backend
+# local só alcança o próprio processo: as reservas feitas pelo worker da fila
+# (COMPRAS_PROCESSAMENTO='fila') não chegam ao SSE, e o check api.W001 avisa disso
+TEMPO_REAL_JANELA_MS = config('TEMPO_REAL_JANELA_MS', default=250, cast=int)
+TEMPO_REAL_BACKEND = config(
+    'TEMPO_REAL_BACKEND',
+    default='api.services.tempo_real.BackendRedis' if REDIS_URL else 'api.services.tempo_real.BackendLocal',
+)
 
 
 # Password validation
@@ -113,6 +197,16 @@ REST_FRAMEWORK = {
         'PAGE_SIZE': 25
 }
 
+# "fila": a reserva dos números roda no worker `manage.py processar_compras`;
+# "imediato": roda logo após o commit, no próprio processo (desenvolvimento)
+COMPRAS_PROCESSAMENTO = config('COMPRAS_PROCESSAMENTO', default='fila')
+
+# Por quanto tempo a resposta de um POST com Idempotency-Key fica no cache
+IDEMPOTENCIA_CACHE_SEGUNDOS = config('IDEMPOTENCIA_CACHE_SEGUNDOS', default=300, cast=int)
+
+# Minutos que os números de uma compra pendente ficam reservados antes de voltarem ao estoque
+SORTEIO_RESERVA_MINUTOS = config('SORTEIO_RESERVA_MINUTOS', default=15, cast=int)
+
 REST_AUTH = {
     "USE_JWT": True,
     "JWT_AUTH_HTTPONLY": False,
@@ -1,9 +1,32 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from api.models import *
+from api.services.apuracao import ApuracaoInvalida, apurar
+
+
+@admin.action(description="Encerrar vendas e sortear vencedores")
+def realizar_apuracao(modeladmin, request, queryset):
+    for sorteio in queryset:
+        try:
+            apuracao = apurar(sorteio)
+        except ApuracaoInvalida as exc:
+            modeladmin.message_user(request, f"{sorteio}: {exc}", messages.ERROR)
+            continue
+        numeros = ", ".join(str(v["numero"]) for v in apuracao.vencedores)
+        modeladmin.message_user(request, f"{sorteio}: vencedores {numeros}", messages.SUCCESS)
+
+
+class SorteioAdmin(admin.ModelAdmin):
+    list_display = ("titulo", "status", "qtd_vendidos", "numeros_totais")
+    readonly_fields = Sorteio.CONTADORES
+    actions = [realizar_apuracao]
+
 
 admin.site.register(User)
-admin.site.register(Sorteio)
+admin.site.register(Sorteio, SorteioAdmin)
 admin.site.register(SiteConfig) 
 admin.site.register(SorteioNumero)
 admin.site.register(Comprar)
 admin.site.register(Raspadinha)
+admin.site.register(SorteioPremiacao)
+admin.site.register(TarefaCompra)
+admin.site.register(SorteioApuracao)
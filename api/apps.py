@@ -6,4 +6,9 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        from django.core import checks
+
+        from api.services.tempo_real import verificar_backend
+
+        checks.register(verificar_backend)
         import api.signals
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+Medição de consultas SQL e tempo por rota da API.
+
+`InstrumentacaoMiddleware` conta as consultas e o tempo de SQL de cada requisição
+(em WSGI e em ASGI, inclusive nas views assíncronas e no ORM assíncrono),
+junto com o tempo total, o tempo de serialização (medido pelo `InstrumentadoMixin`
+das viewsets) e o tamanho da resposta. Cada requisição vira uma linha JSON no logger
+`api.metricas` e é somada nas estatísticas em memória servidas por `/api/v1/metricas/`.
+
+`limite_de_consultas` é o helper de teste para travar orçamentos de consultas:
+
+    with limite_de_consultas(4):
+        client.get("/api/v1/compras/")
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger("api.metricas")
+
+_medicao_atual = contextvars.ContextVar("medicao_atual", default=None)
+_lock = threading.Lock()
+_estatisticas = {}
+
+
+class Medicao:
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.tempo_serializacao = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # usado como execute_wrapper em cada conexão
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.tempo_sql += time.perf_counter() - inicio
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    # instalado uma vez em cada conexão; o contextvar chega também às threads do
+    # sync_to_async, então vale para o ORM assíncrono
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    return medicao(execute, sql, params, many, context)
+
+
+def _instrumentar_conexao(sender=None, connection=None, **kwargs):
+    if _medir_consulta not in connection.execute_wrappers:
+        # no início da lista: `execute_wrapper()` remove com pop() o que ele mesmo pôs no fim
+        connection.execute_wrappers.insert(0, _medir_consulta)
+
+
+def registrar(rota, medicao, tempo_total, tamanho):
+    with _lock:
+        total = _estatisticas.setdefault(rota, {
+            "requisicoes": 0, "consultas": 0, "max_consultas": 0,
+            "tempo_sql": 0.0, "tempo_serializacao": 0.0, "tempo_total": 0.0,
+            "max_tempo_total": 0.0, "bytes": 0,
+        })
+        total["requisicoes"] += 1
+        total["consultas"] += medicao.consultas
+        total["max_consultas"] = max(total["max_consultas"], medicao.consultas)
+        total["tempo_sql"] += medicao.tempo_sql
+        total["tempo_serializacao"] += medicao.tempo_serializacao
+        total["tempo_total"] += tempo_total
+        total["max_tempo_total"] = max(total["max_tempo_total"], tempo_total)
+        total["bytes"] += tamanho
+
+
+def estatisticas():
+    """Totais e médias por rota desde que o processo subiu."""
+    with _lock:
+        copia = {rota: dict(total) for rota, total in _estatisticas.items()}
+    for total in copia.values():
+        n = total["requisicoes"]
+        total["media_consultas"] = total["consultas"] / n
+        total["media_ms"] = total["tempo_total"] * 1000 / n
+        total["media_sql_ms"] = total["tempo_sql"] * 1000 / n
+        total["media_serializacao_ms"] = total["tempo_serializacao"] * 1000 / n
+        total["media_bytes"] = total["bytes"] / n
+    return copia
+
+
+def zerar_estatisticas():
+    with _lock:
+        _estatisticas.clear()
+
+
+class InstrumentacaoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "API_INSTRUMENTACAO", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_instrumentar_conexao, dispatch_uid="api.instrumentacao")
+        for conexao in connections.all(initialized_only=True):
+            _instrumentar_conexao(connection=conexao)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._chamar_async(request)
+        medicao = Medicao()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._registrar(request, response, medicao, time.perf_counter() - inicio)
+
+    async def _chamar_async(self, request):
+        medicao = Medicao()
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._registrar(request, response, medicao, time.perf_counter() - inicio)
+
+    def _registrar(self, request, response, medicao, tempo_total):
+        match = request.resolver_match
+        # rotas do router DRF são regex ("^compras/$"); a âncora só atrapalha a leitura
+        rota = f"{request.method} /{match.route.replace('^', '').replace('$', '')}" if match else f"{request.method} (sem rota)"
+        tamanho = 0 if response.streaming else len(response.content)
+        registrar(rota, medicao, tempo_total, tamanho)
+        logger.info(json.dumps({
+            "rota": rota,
+            "status": response.status_code,
+            "consultas": medicao.consultas,
+            "sql_ms": round(medicao.tempo_sql * 1000, 2),
+            "serializacao_ms": round(medicao.tempo_serializacao * 1000, 2),
+            "total_ms": round(tempo_total * 1000, 2),
+            "bytes": tamanho,
+        }))
+        response["X-Consultas-SQL"] = str(medicao.consultas)
+        return response
+
+
+class InstrumentadoMixin:
+    """Mede o tempo gasto em `to_representation` dos serializers da viewset."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        medicao = _medicao_atual.get()
+        if medicao is not None:
+            original = serializer.to_representation
+
+            def medido(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    medicao.tempo_serializacao += time.perf_counter() - inicio
+
+            serializer.to_representation = medido
+        return serializer
+
+
+@contextlib.contextmanager
+def limite_de_consultas(maximo, using="default"):
+    """Falha (AssertionError) se o bloco rodar mais que `maximo` consultas SQL."""
+    with CaptureQueriesContext(connections[using]) as capturadas:
+        yield capturadas
+    if len(capturadas) > maximo:
+        consultas = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(capturadas.captured_queries, 1))
+        raise AssertionError(f"{len(capturadas)} consultas executadas, limite era {maximo}:\n{consultas}")
@@ -0,0 +1,73 @@
+"""Peças comuns dos comandos de carga (teste_carga_alocacao, benchmark_compras)."""
+import uuid
+from collections import Counter
+
+from api.models import Comprar, Sorteio, SorteioBloco, SorteioNumero, User
+from api.services.contadores import verificar_contadores
+
+
+def descrever_banco(conexao):
+    """Backend e ajustes da conexão, para comparar resultados entre configurações."""
+    opcoes = conexao.settings_dict.get("OPTIONS", {})
+    if conexao.vendor == "sqlite":
+        with conexao.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            modo = cursor.fetchone()[0]
+        return f"sqlite (journal_mode={modo}, transaction_mode={opcoes.get('transaction_mode', 'DEFERRED')})"
+    if opcoes.get("pool"):
+        return f"{conexao.vendor} (pool {opcoes['pool']})"
+    return f"{conexao.vendor} (CONN_MAX_AGE={conexao.settings_dict.get('CONN_MAX_AGE')})"
+
+
+def percentil(tempos_ordenados, fracao):
+    if not tempos_ordenados:
+        return 0.0
+    return tempos_ordenados[min(int(len(tempos_ordenados) * fracao), len(tempos_ordenados) - 1)]
+
+
+def criar_sorteio_de_teste(numeros, **campos):
+    return Sorteio.objects.create(
+        titulo=f"Teste de carga {uuid.uuid4().hex[:8]}",
+        numeros_totais=numeros,
+        preco_por_numero=1,
+        status=Sorteio.Status.SELLING,
+        **campos,
+    )
+
+
+def criar_compradores(quantidade):
+    return [
+        User.objects.create(username=f"carga-{marca}", email=f"carga-{marca}@teste.local", cpf=marca[:14])
+        for marca in (uuid.uuid4().hex for _ in range(quantidade))
+    ]
+
+
+def conferir(sorteio):
+    """Erros de consistência do sorteio depois da carga (lista vazia se está tudo certo)."""
+    erros = []
+    linhas = list(SorteioNumero.objects.filter(sorteio=sorteio).values_list("numero", flat=True))
+    escolhidos = Counter(
+        numero
+        for numeros in Comprar.objects.filter(sorteio=sorteio).values_list("números_escolhidos", flat=True)
+        for numero in numeros or []
+    )
+    repetidos = [numero for numero, vezes in escolhidos.items() if vezes > 1]
+    if repetidos:
+        erros.append(f"Números vendidos mais de uma vez: {repetidos[:20]}")
+    if set(escolhidos) != set(linhas):
+        erros.append("Números das compras não batem com as linhas de SorteioNumero.")
+
+    ocupados = 0
+    disponiveis = 0
+    for mapa, livres in SorteioBloco.objects.filter(sorteio=sorteio).values_list("mapa", "disponiveis"):
+        mapa = bytes(mapa)
+        ocupados += len(mapa) - mapa.count(0)
+        disponiveis += livres
+    if ocupados != len(linhas):
+        erros.append(f"Mapa marca {ocupados} números ocupados, mas há {len(linhas)} linhas.")
+    if disponiveis + len(linhas) != sorteio.numeros_totais:
+        erros.append(f"Contagem de disponíveis ({disponiveis}) não fecha com o total do sorteio.")
+    sorteio.refresh_from_db()
+    for campo, (gravado, correto) in verificar_contadores(sorteio).items():
+        erros.append(f"Contador {campo} = {gravado}, deveria ser {correto}.")
+    return erros
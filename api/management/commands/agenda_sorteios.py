@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.services.agenda import executar_agenda, proximo_evento
+
+
+class Command(BaseCommand):
+    help = "Abre e encerra os sorteios cujo comeca_as / termina_em já chegou."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--intervalo", type=int, default=0,
+            help="espera máxima em segundos entre passadas; 0 roda uma vez só",
+        )
+
+    def handle(self, *args, **opts):
+        while True:
+            abertos, encerrados = executar_agenda()
+            if abertos or encerrados or not opts["intervalo"]:
+                self.stdout.write(f"{abertos} sorteios abertos, {encerrados} encerrados.")
+            if not opts["intervalo"]:
+                return
+            # acorda no horário do próximo evento, se vier antes do intervalo
+            espera = opts["intervalo"]
+            proximo = proximo_evento()
+            if proximo is not None:
+                espera = min(espera, max((proximo - timezone.now()).total_seconds(), 0) + 0.1)
+            time.sleep(espera)
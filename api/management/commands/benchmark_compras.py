@@ -0,0 +1,228 @@
+import json
+import multiprocessing
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import TarefaCompra, User
+from api.services.fila import processar_tarefa
+from ._carga import conferir, criar_compradores, criar_sorteio_de_teste, descrever_banco, percentil
+
+MODOS = ("threads", "processos")
+
+
+def _comprador(sorteio_id, user_id, compras, quantidade):
+    """
+    Faz `compras` compras pelo caminho real: POST /api/v1/compras/ (viewset + signal que
+    enfileira) e, em seguida, a tarefa da fila que reserva os números.
+    """
+    cliente = APIClient()
+    cliente.force_authenticate(User.objects.get(pk=user_id))
+    resultado = {"ok": 0, "esgotado": 0, "recusado": 0, "repeticoes": 0, "espera_lock": 0.0,
+                 "tempo_no_banco": 0.0, "tempos": [], "tempos_post": []}
+
+    def medir(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            resultado["tempo_no_banco"] += time.perf_counter() - inicio
+
+    with connection.execute_wrapper(medir):
+        for _ in range(compras):
+            inicio = time.perf_counter()
+            resposta = None
+            for tentativa in range(20):
+                tentativa_inicio = time.perf_counter()
+                try:
+                    resposta = cliente.post(
+                        "/api/v1/compras/", {"sorteio_id": sorteio_id, "quantidade": quantidade}, format="json",
+                    )
+                    break
+                except OperationalError:
+                    # SQLite: "database is locked" mesmo depois do busy_timeout
+                    resultado["repeticoes"] += 1
+                    time.sleep(0.01 * (tentativa + 1))
+                    resultado["espera_lock"] += time.perf_counter() - tentativa_inicio
+            resultado["tempos_post"].append(time.perf_counter() - inicio)
+
+            if resposta is None or resposta.status_code != 201:
+                resultado["recusado"] += 1
+            else:
+                tarefa = TarefaCompra.objects.select_related("comprar__sorteio").get(comprar_id=resposta.data["id"])
+                if processar_tarefa(tarefa) == TarefaCompra.Status.DONE:
+                    resultado["ok"] += 1
+                else:
+                    resultado["esgotado"] += 1
+            resultado["tempos"].append(time.perf_counter() - inicio)
+    connection.close()
+    return resultado
+
+
+class _AmostradorDeLocks(threading.Thread):
+    """No PostgreSQL, conta periodicamente as sessões esperando lock (pg_stat_activity)."""
+
+    def __init__(self, intervalo=0.05):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.amostras = []
+        self.parar = threading.Event()
+
+    def run(self):
+        try:
+            while not self.parar.is_set():
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock'")
+                    self.amostras.append(cursor.fetchone()[0])
+                self.parar.wait(self.intervalo)
+        finally:
+            connection.close()
+
+    def resumo(self):
+        if not self.amostras:
+            return None
+        return {"max": max(self.amostras), "media": round(sum(self.amostras) / len(self.amostras), 2)}
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, text=True, stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark do caminho de compra: sorteios de vários tamanhos, compras concorrentes "
+        "de threads e processos, vazão, p50/p99, esperas por lock e conferência de consistência."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tamanhos", default="10000,100000,1000000", help="números por sorteio, separados por vírgula")
+        parser.add_argument("--modos", default="threads,processos", help="threads, processos ou ambos")
+        parser.add_argument("--concorrencia", type=int, default=8, help="threads/processos simultâneos")
+        parser.add_argument("--compras", type=int, default=50, help="compras por thread/processo")
+        parser.add_argument("--quantidade", type=int, default=10, help="números por compra")
+        parser.add_argument("--saida", help="grava o resultado em JSON neste arquivo")
+        parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+        parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita antes de acusar regressão (0.2 = 20%%)")
+        parser.add_argument("--manter", action="store_true", help="não apaga os sorteios de teste no final")
+
+    def handle(self, *args, **opts):
+        modos = [modo.strip() for modo in opts["modos"].split(",") if modo.strip()]
+        if set(modos) - set(MODOS):
+            raise CommandError(f"Modos válidos: {', '.join(MODOS)}.")
+        tamanhos = [int(tamanho) for tamanho in opts["tamanhos"].split(",")]
+
+        relatorio = {
+            "commit": _commit_atual(),
+            "banco": descrever_banco(connections["default"]),
+            "executado_em": timezone.now().isoformat(),
+            "parametros": {chave: opts[chave] for chave in ("concorrencia", "compras", "quantidade")},
+            "resultados": [],
+        }
+        self.stdout.write(f"Banco: {relatorio['banco']}  commit: {relatorio['commit']}")
+
+        falhas = []
+        for tamanho in tamanhos:
+            for modo in modos:
+                resultado = self.rodar(tamanho, modo, opts)
+                relatorio["resultados"].append(resultado)
+                self.stdout.write(
+                    f"{tamanho:>9} números, {modo:<9}: {resultado['compras_por_s']:.1f} compras/s, "
+                    f"p50 {resultado['p50_ms']:.1f}ms, p99 {resultado['p99_ms']:.1f}ms, "
+                    f"{resultado['repeticoes_por_lock']} repetições por lock, "
+                    f"{resultado['esgotadas']} sem estoque"
+                )
+                falhas.extend(f"{tamanho}/{modo}: {erro}" for erro in resultado["erros"])
+
+        if opts["saida"]:
+            with open(opts["saida"], "w") as arquivo:
+                json.dump(relatorio, arquivo, indent=2)
+        if opts["comparar"]:
+            falhas.extend(self.comparar(relatorio, opts["comparar"], opts["tolerancia"]))
+        if falhas:
+            raise CommandError("\n".join(falhas))
+        self.stdout.write(self.style.SUCCESS("Nenhuma venda dupla, contadores corretos."))
+
+    def rodar(self, tamanho, modo, opts):
+        sorteio = criar_sorteio_de_teste(tamanho)
+        usuarios = criar_compradores(opts["concorrencia"])
+        argumentos = [(sorteio.pk, usuario.pk, opts["compras"], opts["quantidade"]) for usuario in usuarios]
+        amostrador = _AmostradorDeLocks() if connection.vendor == "postgresql" else None
+
+        connections.close_all()  # filhos e threads abrem conexões próprias
+        inicio = time.perf_counter()
+        if modo == "processos":
+            with multiprocessing.get_context("fork").Pool(opts["concorrencia"]) as pool:
+                if amostrador:
+                    amostrador.start()
+                resultados = pool.starmap(_comprador, argumentos)
+        else:
+            if amostrador:
+                amostrador.start()
+            with ThreadPoolExecutor(opts["concorrencia"]) as executor:
+                resultados = list(executor.map(lambda args: _comprador(*args), argumentos))
+        duracao = time.perf_counter() - inicio
+        if amostrador:
+            amostrador.parar.set()
+            amostrador.join()
+
+        try:
+            erros = conferir(sorteio)
+        finally:
+            if not opts["manter"]:
+                sorteio.delete()
+                User.objects.filter(pk__in=[u.pk for u in usuarios]).delete()
+
+        tempos = sorted(t for r in resultados for t in r["tempos"])
+        tempos_post = sorted(t for r in resultados for t in r["tempos_post"])
+        ok = sum(r["ok"] for r in resultados)
+        return {
+            "numeros": tamanho,
+            "modo": modo,
+            "compras_ok": ok,
+            "esgotadas": sum(r["esgotado"] for r in resultados),
+            "recusadas": sum(r["recusado"] for r in resultados),
+            "duracao_s": round(duracao, 3),
+            "compras_por_s": round(ok / duracao, 2) if duracao else 0.0,
+            "p50_ms": round(percentil(tempos, 0.5) * 1000, 2),
+            "p99_ms": round(percentil(tempos, 0.99) * 1000, 2),
+            "p99_post_ms": round(percentil(tempos_post, 0.99) * 1000, 2),
+            "repeticoes_por_lock": sum(r["repeticoes"] for r in resultados),
+            "espera_lock_s": round(sum(r["espera_lock"] for r in resultados), 3),
+            "tempo_no_banco_s": round(sum(r["tempo_no_banco"] for r in resultados), 3),
+            "sessoes_esperando_lock": amostrador.resumo() if amostrador else None,
+            "erros": erros,
+        }
+
+    def comparar(self, relatorio, caminho, tolerancia):
+        """Compara com uma execução anterior; devolve as regressões acima da tolerância."""
+        with open(caminho) as arquivo:
+            anterior = json.load(arquivo)
+        base = {(r["numeros"], r["modo"]): r for r in anterior["resultados"]}
+        regressoes = []
+        self.stdout.write(f"Comparando com {anterior.get('commit')} ({anterior.get('banco')}):")
+        for atual in relatorio["resultados"]:
+            antes = base.get((atual["numeros"], atual["modo"]))
+            if antes is None:
+                continue
+            vazao = atual["compras_por_s"] / antes["compras_por_s"] - 1 if antes["compras_por_s"] else 0.0
+            p99 = atual["p99_ms"] / antes["p99_ms"] - 1 if antes["p99_ms"] else 0.0
+            self.stdout.write(
+                f"{atual['numeros']:>9} números, {atual['modo']:<9}: vazão {vazao:+.0%}, p99 {p99:+.0%}"
+            )
+            if vazao < -tolerancia or p99 > tolerancia:
+                regressoes.append(
+                    f"Regressão em {atual['numeros']}/{atual['modo']}: vazão {vazao:+.0%}, p99 {p99:+.0%}"
+                )
+        return regressoes
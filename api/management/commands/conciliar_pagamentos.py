@@ -0,0 +1,53 @@
+import csv
+import json
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.pagamentos import aplicar_pagamentos
+
+
+def _ler_csv(arquivo):
+    yield from csv.DictReader(arquivo)
+
+
+def _ler_ndjson(arquivo):
+    for linha in arquivo:
+        if linha.strip():
+            yield json.loads(linha)
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica um arquivo de conciliação do provedor de pagamentos "
+        "(CSV ou NDJSON com pagamento_ref, status e pago_em) em lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="caminho do arquivo, ou - para ler da entrada padrão")
+        parser.add_argument("--formato", choices=["csv", "ndjson"], help="padrão: pela extensão do arquivo")
+        parser.add_argument("--lote", type=int, default=1000)
+        parser.add_argument("--saida", help="grava o resultado de cada item neste arquivo NDJSON")
+
+    def handle(self, *args, **opts):
+        formato = opts["formato"] or ("csv" if opts["arquivo"].endswith(".csv") else "ndjson")
+        leitor = _ler_csv if formato == "csv" else _ler_ndjson
+        arquivo = sys.stdin if opts["arquivo"] == "-" else open(opts["arquivo"], newline="", encoding="utf-8")
+        saida = open(opts["saida"], "w", encoding="utf-8") if opts["saida"] else None
+
+        resumo = Counter()
+        try:
+            for resultado in aplicar_pagamentos(leitor(arquivo), lote=opts["lote"]):
+                resumo[resultado["resultado"]] += 1
+                if saida:
+                    saida.write(json.dumps(resultado) + "\n")
+        except (ValueError, KeyError) as exc:
+            raise CommandError(f"Arquivo inválido: {exc}")
+        finally:
+            if arquivo is not sys.stdin:
+                arquivo.close()
+            if saida:
+                saida.close()
+
+        self.stdout.write(", ".join(f"{quantidade} {resultado}" for resultado, quantidade in sorted(resumo.items())))
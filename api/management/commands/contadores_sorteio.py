@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Sorteio
+from api.services.contadores import recalcular_contadores, verificar_contadores
+
+
+class Command(BaseCommand):
+    help = "Confere (ou reconstrói com --corrigir) os contadores dos sorteios a partir do estoque."
+
+    def add_arguments(self, parser):
+        parser.add_argument("sorteios", nargs="*", type=int, help="ids dos sorteios; padrão: todos")
+        parser.add_argument("--corrigir", action="store_true", help="grava os valores recalculados")
+
+    def handle(self, *args, **opts):
+        sorteios = Sorteio.objects.order_by("pk")
+        if opts["sorteios"]:
+            sorteios = sorteios.filter(pk__in=opts["sorteios"])
+
+        divergentes = 0
+        for sorteio in sorteios.iterator():
+            with transaction.atomic():
+                diferencas = verificar_contadores(sorteio)
+                if not diferencas:
+                    continue
+                divergentes += 1
+                for campo, (gravado, correto) in diferencas.items():
+                    self.stdout.write(f"Sorteio {sorteio.pk}: {campo} = {gravado}, deveria ser {correto}")
+                if opts["corrigir"]:
+                    recalcular_contadores(sorteio)
+
+        if divergentes and not opts["corrigir"]:
+            raise CommandError(f"{divergentes} sorteio(s) com contadores divergentes; rode com --corrigir.")
+        self.stdout.write(self.style.SUCCESS(f"Contadores conferidos; {divergentes} sorteio(s) corrigido(s)."))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.reservas import liberar_reservas_expiradas
+
+
+class Command(BaseCommand):
+    help = "Devolve ao estoque os números de compras pendentes cuja reserva venceu."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--intervalo", type=int, default=0, help="segundos entre varreduras; 0 roda uma vez só")
+        parser.add_argument("--lote", type=int, default=500, help="compras liberadas por transação")
+
+    def handle(self, *args, **opts):
+        while True:
+            liberadas = liberar_reservas_expiradas(lote=opts["lote"])
+            if liberadas or not opts["intervalo"]:
+                self.stdout.write(f"{liberadas} compras com reserva vencida liberadas.")
+            if not opts["intervalo"]:
+                return
+            time.sleep(opts["intervalo"])
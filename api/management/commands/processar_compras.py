@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.fila import processar_lote
+
+
+class Command(BaseCommand):
+    help = "Worker da fila de compras: reserva os números das compras enfileiradas, em lotes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=100, help="tarefas pegas por vez")
+        parser.add_argument("--espera", type=float, default=0.5, help="segundos de pausa quando a fila está vazia")
+        parser.add_argument("--uma-vez", action="store_true", help="esvazia a fila e sai")
+
+    def handle(self, *args, **opts):
+        while True:
+            resultado = processar_lote(opts["lote"])
+            if resultado:
+                self.stdout.write(", ".join(f"{quantidade} {status}" for status, quantidade in resultado.items()))
+            elif opts["uma_vez"]:
+                return
+            else:
+                time.sleep(opts["espera"])
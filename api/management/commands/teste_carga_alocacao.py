@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+
+from api.models import Comprar, Sorteio, User
+from api.services.alocacao import AlocacaoDisputada, NumerosIndisponiveis
+from api.services.reservas import reservar_numeros
+from ._carga import conferir, criar_compradores, criar_sorteio_de_teste, descrever_banco, percentil
+
+
+def _comprador(sorteio_id, user_id, compras, quantidade):
+    """Roda num processo filho: faz `compras` compras seguidas e devolve as estatísticas."""
+    sorteio = Sorteio.objects.get(pk=sorteio_id)
+    resultado = {"ok": 0, "esgotado": 0, "repeticoes": 0, "tempos": []}
+    for _ in range(compras):
+        inicio = time.perf_counter()
+        for tentativa in range(20):
+            try:
+                with transaction.atomic():
+                    comprar = Comprar.objects.create(
+                        user_id=user_id, sorteio=sorteio, quantidade=quantidade,
+                        preco_unitario=sorteio.preco_por_numero,
+                        total_preco=sorteio.preco_por_numero * quantidade,
+                    )
+                    # reserva direto, sem esperar o worker da fila
+                    reservar_numeros(comprar)
+                resultado["ok"] += 1
+                break
+            except AlocacaoDisputada:
+                # conflitos demais com as outras threads: repete, como faria a fila
+                resultado["repeticoes"] += 1
+            except NumerosIndisponiveis:
+                resultado["esgotado"] += 1
+                break
+            except OperationalError:
+                # SQLite: "database is locked" sob escrita concorrente
+                resultado["repeticoes"] += 1
+                time.sleep(0.01 * (tentativa + 1))
+        resultado["tempos"].append(time.perf_counter() - inicio)
+    connections.close_all()
+    return resultado
+
+
+class Command(BaseCommand):
+    help = "Dispara compras concorrentes de vários processos e confere que nenhum número foi vendido duas vezes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--numeros", type=int, default=100_000)
+        parser.add_argument("--processos", type=int, default=8)
+        parser.add_argument("--compras", type=int, default=50, help="compras por processo")
+        parser.add_argument("--quantidade", type=int, default=10, help="números por compra")
+        parser.add_argument("--manter", action="store_true", help="não apaga o sorteio de teste no final")
+
+    def handle(self, *args, **opts):
+        self.stdout.write(f"Banco: {descrever_banco(connections['default'])}")
+        sorteio = criar_sorteio_de_teste(opts["numeros"])
+        usuarios = criar_compradores(opts["processos"])
+
+        connections.close_all()  # os filhos abrem conexões próprias
+        contexto = multiprocessing.get_context("fork")
+        inicio = time.perf_counter()
+        with contexto.Pool(opts["processos"]) as pool:
+            resultados = pool.starmap(
+                _comprador,
+                [(sorteio.pk, usuario.pk, opts["compras"], opts["quantidade"]) for usuario in usuarios],
+            )
+        duracao = time.perf_counter() - inicio
+
+        try:
+            erros = conferir(sorteio)
+            ok = sum(r["ok"] for r in resultados)
+            tempos = sorted(t for r in resultados for t in r["tempos"])
+            self.stdout.write(
+                f"{ok} compras em {duracao:.2f}s ({ok / duracao:.1f}/s), "
+                f"{sum(r['esgotado'] for r in resultados)} sem estoque, "
+                f"{sum(r['repeticoes'] for r in resultados)} repetições por lock, "
+                f"p50 {percentil(tempos, 0.5) * 1000:.1f}ms, "
+                f"p99 {percentil(tempos, 0.99) * 1000:.1f}ms"
+            )
+        finally:
+            if not opts["manter"]:
+                sorteio.delete()
+                User.objects.filter(pk__in=[u.pk for u in usuarios]).delete()
+
+        if erros:
+            raise CommandError("\n".join(erros))
+        self.stdout.write(self.style.SUCCESS("Nenhuma venda dupla ou excedente."))
@@ -43,24 +43,63 @@ class Sorteio(models.Model):
         CLOSED = "closed", "Encerrada (aguardando sorteio)"
         DRAWN = "drawn", "Sorteada"
 
+    class ModoAlocacao(models.TextChoices):
+        ALEATORIO = "aleatorio", "Números aleatórios"
+        SEQUENCIAL = "sequencial", "Números em sequência"
+
+    class ModoPremiacao(models.TextChoices):
+        INDEPENDENTE = "independente", "Prêmio sorteado a cada raspadinha"
+        LOTE = "lote", "Lote de prêmios pré-gerado na abertura"
+
     titulo = models.CharField(max_length=140)
     descricao = models.TextField(blank=True)
     numeros_totais = models.PositiveIntegerField()
     preco_por_numero = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(max_length=16, choices=Status.choices, default=Status.DRAFT)
+    modo_alocacao = models.CharField(max_length=12, choices=ModoAlocacao.choices, default=ModoAlocacao.ALEATORIO)
+    modo_premiacao = models.CharField(max_length=12, choices=ModoPremiacao.choices, default=ModoPremiacao.INDEPENDENTE)
     comeca_as = models.DateTimeField(null=True, blank=True)
     termina_em = models.DateTimeField(null=True, blank=True)
     image = models.ImageField(upload_to="sorteios/", null=True, blank=True)
     regras = models.TextField(blank=True)
     criado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name="raffles_created")
     criado_em = models.DateTimeField(auto_now_add=True)
+    # contadores mantidos na mesma transação que muda o estoque (ver services/contadores.py);
+    # só mudam por UPDATE com F(), nunca pelo save() da instância (ver `save`)
+    qtd_disponiveis = models.PositiveIntegerField(default=0, editable=False)
+    qtd_reservados = models.PositiveIntegerField(default=0, editable=False)
+    qtd_vendidos = models.PositiveIntegerField(default=0, editable=False)
+    qtd_vencedores = models.PositiveIntegerField(default=0, editable=False)
+    receita = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    # commit/reveal (ver services/aleatoriedade.py): o hash é público desde a criação,
+    # a semente só é revelada na apuração
+    semente_servidor = models.CharField(max_length=64, blank=True, editable=False)
+    hash_semente = models.CharField(max_length=64, blank=True, editable=False)
+    semente_revelada_em = models.DateTimeField(null=True, blank=True, editable=False)
+
+    CONTADORES = ("qtd_disponiveis", "qtd_reservados", "qtd_vendidos", "qtd_vencedores", "receita")
 
     def __str__(self):
         return self.titulo
 
+    def save(self, *args, **kwargs):
+        # um save() completo (admin, PUT/PATCH) regravaria os contadores lidos antes,
+        # apagando os incrementos feitos pelas compras nesse meio tempo
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CONTADORES
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Sorteio"
         verbose_name_plural = "Sorteios"
+        # agenda de abertura/encerramento (services/agenda.py)
+        indexes = [
+            models.Index(fields=["status", "comeca_as"]),
+            models.Index(fields=["status", "termina_em"]),
+        ]
 
 class Comprar(models.Model):
     class Status(models.TextChoices):
@@ -68,7 +107,8 @@ class Comprar(models.Model):
         PAID = "paid", "Pago"
         CANCELED = "canceled", "Cancelado"
 
-    chave_idempotencia = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # vem do header Idempotency-Key quando o cliente manda; senão é gerada aqui
+    chave_idempotencia = models.UUIDField(default=uuid.uuid4, unique=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="compras")
     sorteio = models.ForeignKey(Sorteio, on_delete=models.CASCADE, related_name="compras")
     quantidade = models.PositiveIntegerField()
@@ -76,7 +116,7 @@ class Comprar(models.Model):
     total_preco = models.DecimalField(max_digits=12, decimal_places=2)
     status = models.CharField(max_length=12, choices=Status.choices, default=Status.PENDING)
     provedor_de_pagamento = models.CharField(max_length=30, blank=True)   
-    pagamento_ref = models.CharField(max_length=140, blank=True)       
+    pagamento_ref = models.CharField(max_length=140, blank=True, db_index=True)
     criado_em = models.DateTimeField(auto_now_add=True)
     pago_em = models.DateTimeField(null=True, blank=True)
     números_escolhidos = models.JSONField(null=True, blank=True)
@@ -87,6 +127,47 @@ class Comprar(models.Model):
     class Meta:
         verbose_name = "Comprar"
         verbose_name_plural = "Comprar"
+        constraints = [
+            # a conciliação (services/pagamentos.py) acha a compra pela referência do provedor
+            models.UniqueConstraint(
+                fields=["pagamento_ref"], condition=~models.Q(pagamento_ref=""), name="comprar_pagamento_ref_unico",
+            ),
+        ]
+
+class TarefaCompra(models.Model):
+    """
+    Pós-processamento de uma compra (reserva dos números), enfileirado na mesma
+    transação que cria a Comprar e executado pelo comando `processar_compras`.
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pendente"
+        PROCESSING = "processing", "Processando"
+        DONE = "done", "Concluída"
+        FAILED = "failed", "Falhou"
+
+    comprar = models.OneToOneField(Comprar, on_delete=models.CASCADE, related_name="tarefa")
+    chave_idempotencia = models.UUIDField(unique=True)
+    # pedido como estava no checkout; o worker reserva e cobra por ele (ver services/fila.py)
+    sorteio = models.ForeignKey(Sorteio, null=True, on_delete=models.CASCADE, related_name="+")
+    quantidade = models.PositiveIntegerField(null=True)
+    preco_unitario = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    status = models.CharField(max_length=12, choices=Status.choices, default=Status.PENDING)
+    tentativas = models.PositiveIntegerField(default=0)
+    # próxima tentativa; enquanto PROCESSING, é o fim do prazo do worker que pegou a tarefa
+    disponivel_em = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Tarefa da compra {self.comprar_id} ({self.status})"
+
+    class Meta:
+        verbose_name = "Tarefa de compra"
+        verbose_name_plural = "Tarefas de compra"
+        indexes = [
+            models.Index(fields=["status", "disponivel_em"]),
+        ]
 
 class SorteioNumero(models.Model):
     
@@ -106,19 +187,86 @@ class SorteioNumero(models.Model):
     reservado_até = models.DateTimeField(null=True, blank=True)
     comprar = models.ForeignKey(Comprar, null=True, blank=True, on_delete=models.SET_NULL, related_name="numeros")
 
+    def __str__(self):
+        return f"{self.sorteio.titulo} - #{self.numero} ({self.status})"
+
     class Meta:
-        unique_together = ("sorteiro", "numero")
+        verbose_name = "Número de rifa"
+        verbose_name_plural = "Números de rifas"
+        unique_together = ("sorteio", "numero")
         indexes = [
-            models.Index(fields=["sorteio", "status"]),
-            models.Index(fields=["sorteio", "numero"]),
+            # também atende filtros só por (sorteio, status); usado pela varredura de reservas vencidas
+            models.Index(fields=["sorteio", "status", "reservado_até"]),
+            # "meus números" (services/meus_numeros.py)
+            models.Index(fields=["proprietario", "sorteio", "numero"]),
         ]
 
+class SorteioBloco(models.Model):
+    """
+    Fatia compacta do estoque de um sorteio: um byte de status por número.
+    O bloco `indice` cobre os números [indice * TAMANHO_BLOCO + 1, (indice + 1) * TAMANHO_BLOCO].
+    Só números reservados/vendidos/vencedores viram linhas em SorteioNumero.
+    """
+    sorteio = models.ForeignKey(Sorteio, on_delete=models.CASCADE, related_name="blocos")
+    indice = models.PositiveIntegerField()
+    mapa = models.BinaryField()
+    disponiveis = models.PositiveIntegerField()
+    # incrementada a cada escrita no mapa; a alocação só grava se a versão lida não mudou
+    versao = models.PositiveIntegerField(default=0)
+
     def __str__(self):
-        return f"{self.sorteio.titulo} - #{self.numero} ({self.status})"
+        return f"{self.sorteio_id} - bloco {self.indice} ({self.disponiveis} disponíveis)"
 
     class Meta:
-        verbose_name = "Número de rifa"
-        verbose_name_plural = "Números de rifas"
+        verbose_name = "Bloco de números"
+        verbose_name_plural = "Blocos de números"
+        unique_together = ("sorteio", "indice")
+        indexes = [
+            models.Index(fields=["sorteio", "disponiveis"]),
+        ]
+
+class SorteioPremiacao(models.Model):
+    """
+    Lote de prêmios das raspadinhas de um sorteio, gerado na abertura das vendas.
+    Guarda só quantos cartões existem de cada prêmio e a semente da embaralhada:
+    o prêmio da posição `p` do lote é recalculado a partir dela, e cada compra
+    paga retira as próximas posições avançando `cursor`.
+    """
+    sorteio = models.OneToOneField(Sorteio, on_delete=models.CASCADE, related_name="premiacao")
+    # [{"premio": "5.00", "quantidade": 150}, ...], somando numeros_totais
+    faixas = models.JSONField(default=list)
+    semente = models.CharField(max_length=64)
+    cursor = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Premiação de {self.sorteio_id} ({self.cursor} cartões entregues)"
+
+    class Meta:
+        verbose_name = "Premiação de raspadinhas"
+        verbose_name_plural = "Premiações de raspadinhas"
+
+class SorteioApuracao(models.Model):
+    """
+    Resultado do sorteio e o que é preciso para refazê-lo: os vencedores saem
+    deterministicamente de `semente` + mapa de vendidos no fechamento (`hash_mapa`).
+    """
+    sorteio = models.OneToOneField(Sorteio, on_delete=models.CASCADE, related_name="apuracao")
+    semente = models.CharField(max_length=64)
+    hash_mapa = models.CharField(max_length=64)
+    total_vendidos = models.PositiveIntegerField()
+    # [{"nome": "1º prêmio", "quantidade": 1}, ...]
+    faixas = models.JSONField(default=list)
+    # [{"faixa": "1º prêmio", "numero": 123, "comprar": 45, "user": 6}, ...]
+    vencedores = models.JSONField(default=list)
+    realizado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Apuração de {self.sorteio_id}"
+
+    class Meta:
+        verbose_name = "Apuração de sorteio"
+        verbose_name_plural = "Apurações de sorteios"
 
 class Raspadinha(models.Model):
     """Raspadinha bônus vinculada a uma compra. Resultado revelado quando 'scratch'."""
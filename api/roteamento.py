@@ -0,0 +1,63 @@
+"""
+Roteamento de leituras para réplicas.
+
+Views marcadas com `LeituraEmReplicaMixin` ligam um contextvar durante as ações
+listadas em `acoes_em_replica`; enquanto ele está ligado, as leituras vão para uma
+das conexões `replica_*` de settings.DATABASES. Sem réplicas configuradas, ou fora
+dessas ações, tudo continua no banco `default`.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+
+_em_replica = contextvars.ContextVar("leitura_em_replica", default=False)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica_")]
+
+
+@contextlib.contextmanager
+def no_principal():
+    """Leituras do bloco vão para o `default` mesmo dentro de uma ação em réplica."""
+    token = _em_replica.set(False)
+    try:
+        yield
+    finally:
+        _em_replica.reset(token)
+
+
+class RoteadorDeReplicas:
+    def db_for_read(self, model, **hints):
+        if not _em_replica.get():
+            return None
+        disponiveis = replicas()
+        return random.choice(disponiveis) if disponiveis else None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # réplicas espelham o principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class LeituraEmReplicaMixin:
+    acoes_em_replica = ("list", "retrieve")
+
+    def initial(self, request, *args, **kwargs):
+        if self.action in self.acoes_em_replica:
+            self._token_replica = _em_replica.set(True)
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_token_replica", None)
+        if token is not None:
+            _em_replica.reset(token)
+            self._token_replica = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -7,3 +7,5 @@ router = routers.DefaultRouter()
 router.register("sorteios", SorteioViewSet, basename="sorteios")
 router.register("compras", ComprarViewSet, basename="compras")
 router.register("raspadinhas", RaspadinhaViewSet, basename="raspadinhas")
+router.register("me/numeros", MeusNumerosViewSet, basename="meus-numeros")
+router.register("metricas", MetricasViewSet, basename="metricas")
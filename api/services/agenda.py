@@ -0,0 +1,119 @@
+"""
+Abertura e encerramento automáticos dos sorteios por `comeca_as` / `termina_em`.
+
+`executar_agenda` move em lote (um UPDATE por transição, apoiado nos índices
+(status, comeca_as) e (status, termina_em)) os sorteios DRAFT cuja abertura chegou
+para SELLING e os SELLING cujo prazo acabou para CLOSED, e roda os ganchos de
+abertura que o UPDATE em lote não dispara pelos signals.
+
+O status de cada sorteio fica também no cache compartilhado, atualizado a cada
+mudança, para que a compra recuse sorteios fechados sem ler o banco. Com um cache
+por processo (locmem) a agenda e os signals de outros processos não chegam até
+ele: aí o status vale só por `STATUS_LOCAL_SEGUNDOS` e uma recusa é confirmada no banco.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from api.models import Sorteio
+from . import aleatoriedade, cache_sorteios, caches, premios
+
+CHAVE_STATUS = "sorteio:status:{}"
+STATUS_LOCAL_SEGUNDOS = 5
+
+
+def ao_abrir(sorteio):
+    """Ganchos da abertura das vendas: semente publicada e, no modo LOTE, o lote de prêmios."""
+    aleatoriedade.comprometer(sorteio)
+    if sorteio.modo_premiacao == Sorteio.ModoPremiacao.LOTE:
+        premios.gerar_premiacao(sorteio)
+
+
+def publicar_status(sorteio):
+    valor = (sorteio.status, sorteio.termina_em.timestamp() if sorteio.termina_em else None)
+    cache.set(
+        CHAVE_STATUS.format(sorteio.pk), valor,
+        timeout=None if caches.compartilhado() else STATUS_LOCAL_SEGUNDOS,
+    )
+    return valor
+
+
+def _status_do_banco(sorteio_id):
+    sorteio = Sorteio.objects.filter(pk=sorteio_id).only("status", "termina_em").first()
+    return publicar_status(sorteio) if sorteio is not None else None
+
+
+def _status_em_cache(sorteio_id):
+    valor = cache.get(CHAVE_STATUS.format(sorteio_id))
+    if valor is None:
+        valor = _status_do_banco(sorteio_id)
+    return valor
+
+
+def _aberto(valor, agora):
+    status, termina_em = valor
+    return status == Sorteio.Status.SELLING and (termina_em is None or agora < termina_em)
+
+
+def vendas_abertas(sorteio_id, agora=None):
+    """
+    True se o sorteio aceita compras agora (None se ele não existe). Com cache
+    compartilhado lê só o cache; o prazo é conferido aqui também, para não vender
+    nos segundos entre `termina_em` e a próxima passada da agenda.
+    """
+    valor = _status_em_cache(sorteio_id)
+    if valor is None:
+        return None
+    agora = (agora or timezone.now()).timestamp()
+    if not _aberto(valor, agora) and not caches.compartilhado():
+        # o cache deste processo pode não ter visto a abertura feita por outro
+        valor = _status_do_banco(sorteio_id)
+        if valor is None:
+            return None
+    return _aberto(valor, agora)
+
+
+def executar_agenda(agora=None):
+    """
+    Aplica as transições vencidas. Retorna (abertos, encerrados). Os UPDATEs
+    repetem a condição de status, então duas agendas rodando juntas não se atrapalham.
+    """
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        abrir = list(
+            Sorteio.objects
+            .filter(status=Sorteio.Status.DRAFT, comeca_as__lte=agora)
+            .exclude(termina_em__lte=agora)
+            .values_list("pk", flat=True)
+        )
+        Sorteio.objects.filter(pk__in=abrir, status=Sorteio.Status.DRAFT).update(status=Sorteio.Status.SELLING)
+
+        # vencidos ainda em rascunho vão direto para encerrado
+        encerrar = list(
+            Sorteio.objects
+            .filter(status__in=[Sorteio.Status.DRAFT, Sorteio.Status.SELLING], termina_em__lte=agora)
+            .values_list("pk", flat=True)
+        )
+        Sorteio.objects.filter(
+            pk__in=encerrar, status__in=[Sorteio.Status.DRAFT, Sorteio.Status.SELLING],
+        ).update(status=Sorteio.Status.CLOSED)
+
+        mudados = list(Sorteio.objects.filter(pk__in=abrir + encerrar))
+        for sorteio in mudados:
+            if sorteio.status == Sorteio.Status.SELLING:
+                ao_abrir(sorteio)
+        transaction.on_commit(lambda: [publicar_status(sorteio) for sorteio in mudados])
+        cache_sorteios.invalidar(*(sorteio.pk for sorteio in mudados))
+    return len(abrir), len(encerrar)
+
+
+def proximo_evento(agora=None):
+    """Quando vence a próxima abertura ou encerramento (None se não houver nada agendado)."""
+    agora = agora or timezone.now()
+    horarios = [
+        Sorteio.objects.filter(status=Sorteio.Status.DRAFT, comeca_as__gt=agora).aggregate(h=Min("comeca_as"))["h"],
+        Sorteio.objects.filter(status=Sorteio.Status.SELLING, termina_em__gt=agora).aggregate(h=Min("termina_em"))["h"],
+    ]
+    horarios = [horario for horario in horarios if horario is not None]
+    return min(horarios) if horarios else None
@@ -0,0 +1,117 @@
+"""
+Aleatoriedade verificável (commit/reveal).
+
+Cada sorteio tem uma semente do servidor gerada na criação; só o SHA-256 dela
+(`hash_semente`) é público até a apuração, quando a semente é revelada. Todo resultado
+(números da compra, prêmio das raspadinhas, lote de prêmios, vencedores) sai de um
+`Fluxo`: HMAC-SHA256(semente, "<contexto>:<contador>") em modo contador, com um
+contexto diferente para cada uso. Cada fluxo é local a quem o criou, então threads
+e processos não disputam um PRNG compartilhado, e com a semente revelada qualquer
+pessoa refaz os resultados usando só hashlib/hmac.
+"""
+import bisect
+import hashlib
+import hmac
+import secrets
+
+from api.models import Sorteio
+
+
+def hash_da_semente(semente):
+    return hashlib.sha256(bytes.fromhex(semente)).hexdigest()
+
+
+def comprometer(sorteio):
+    """Gera a semente do sorteio e publica o hash, se ainda não houver (idempotente)."""
+    if sorteio.semente_servidor:
+        return sorteio.hash_semente
+    semente = secrets.token_hex(32)
+    Sorteio.objects.filter(pk=sorteio.pk, semente_servidor="").update(
+        semente_servidor=semente, hash_semente=hash_da_semente(semente),
+    )
+    # outra transação pode ter gerado antes: vale a que está gravada
+    sorteio.semente_servidor, sorteio.hash_semente = (
+        Sorteio.objects.filter(pk=sorteio.pk).values_list("semente_servidor", "hash_semente").get()
+    )
+    return sorteio.hash_semente
+
+
+def semente_do_sorteio(sorteio):
+    comprometer(sorteio)
+    return sorteio.semente_servidor
+
+
+def verificar_compromisso(semente, hash_semente):
+    return hmac.compare_digest(hash_da_semente(semente), hash_semente)
+
+
+def derivar_chave(semente, contexto):
+    """Sub-semente (hex) para usos que precisam de uma chave própria, como o lote de prêmios."""
+    return hmac.new(bytes.fromhex(semente), contexto.encode(), hashlib.sha256).hexdigest()
+
+
+class Fluxo:
+    """Sequência determinística de bytes para (semente, contexto), com sorteios em lote."""
+
+    def __init__(self, semente, contexto):
+        self.chave = bytes.fromhex(semente)
+        self.contexto = contexto
+        self.contador = 0
+        self.buffer = b""
+
+    @classmethod
+    def do_sorteio(cls, sorteio, contexto):
+        return cls(semente_do_sorteio(sorteio), contexto)
+
+    def _bytes(self, quantidade):
+        while len(self.buffer) < quantidade:
+            mensagem = f"{self.contexto}:{self.contador}".encode()
+            self.buffer += hmac.new(self.chave, mensagem, hashlib.sha256).digest()
+            self.contador += 1
+        saida, self.buffer = self.buffer[:quantidade], self.buffer[quantidade:]
+        return saida
+
+    def bits(self, quantidade):
+        valor = int.from_bytes(self._bytes((quantidade + 7) // 8), "big")
+        return valor >> (-quantidade % 8)
+
+    def abaixo(self, n):
+        """Inteiro uniforme em [0, n), por rejeição (sem viés de módulo)."""
+        tamanho = n.bit_length()
+        while True:
+            valor = self.bits(tamanho)
+            if valor < n:
+                return valor
+
+    def uniforme(self):
+        """Float uniforme em [0, 1) com 53 bits."""
+        return self.bits(53) / (1 << 53)
+
+    def amostra(self, n, k):
+        """k inteiros distintos de [0, n), na ordem em que foram sorteados."""
+        if k > n:
+            raise ValueError("Amostra maior que a população.")
+        if k * 4 > n:
+            # Fisher-Yates parcial quando a amostra é uma fração grande da população
+            populacao = list(range(n))
+            for i in range(k):
+                j = i + self.abaixo(n - i)
+                populacao[i], populacao[j] = populacao[j], populacao[i]
+            return populacao[:k]
+        vistos = set()
+        saida = []
+        while len(saida) < k:
+            valor = self.abaixo(n)
+            if valor not in vistos:
+                vistos.add(valor)
+                saida.append(valor)
+        return saida
+
+    def escolhas(self, populacao, acumulado, k):
+        """k escolhas com reposição, com pesos acumulados (como `random.choices(cum_weights=)`)."""
+        total = acumulado[-1]
+        ultimo = len(populacao) - 1
+        return [
+            populacao[min(bisect.bisect_right(acumulado, self.uniforme() * total), ultimo)]
+            for _ in range(k)
+        ]
@@ -0,0 +1,206 @@
+"""
+Alocação de números para uma compra.
+
+Cada lote de números é reivindicado num único UPDATE condicional sobre um bloco do
+estoque (compare-and-swap pela coluna `versao`), então compras concorrentes nunca
+vendem o mesmo número duas vezes e não ficam presas esperando umas pelas outras:
+no Postgres os blocos já travados são pulados (skip_locked) e, onde não há
+SELECT ... FOR UPDATE, um conflito só faz a compra tentar outro bloco.
+
+No modo aleatório as escolhas saem do fluxo "alocacao:<compra>" da semente do
+sorteio (services/aleatoriedade.py), não do `random` global.
+"""
+import bisect
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from api.models import Sorteio, SorteioBloco, SorteioNumero
+from .aleatoriedade import Fluxo
+from . import meus_numeros, tempo_real
+from .contadores import ajustar_contadores
+from .estoque import (
+    CODIGO_PARA_STATUS, DISPONIVEL, VENDIDO,
+    ler_mapa, localizar, numero_de, posicoes_disponiveis,
+)
+
+# limite de conflitos antes de desistir (evita laço infinito num lançamento muito disputado)
+MAX_CONFLITOS = 32
+
+
+class NumerosIndisponiveis(ValueError):
+    pass
+
+
+class AlocacaoDisputada(NumerosIndisponiveis):
+    """Conflitos demais com compras concorrentes; ao contrário do esgotamento, vale repetir."""
+
+
+def _blocos_livres(sorteio, ignorar):
+    return (
+        SorteioBloco.objects
+        .filter(sorteio=sorteio, disponiveis__gt=0)
+        .exclude(pk__in=ignorar)
+        .order_by("indice")
+    )
+
+
+def _plano_sequencial(sorteio, restantes, ignorar, fluxo):
+    """Primeiro bloco com números livres, na ordem dos números."""
+    livre = _blocos_livres(sorteio, ignorar).values_list("pk", "disponiveis").first()
+    if livre is None:
+        return []
+    pk, disponiveis = livre
+    return [(pk, min(restantes, disponiveis))]
+
+
+def _plano_aleatorio(sorteio, restantes, ignorar, fluxo):
+    """
+    Divide `restantes` entre os blocos de forma que cada número livre tenha a mesma
+    chance: sorteia posições no conjunto de livres (sem materializá-lo) e conta
+    quantas caem em cada bloco. Só lê (pk, disponiveis) de cada bloco.
+    """
+    blocos = list(_blocos_livres(sorteio, ignorar).values_list("pk", "disponiveis"))
+    acumulado = []
+    total = 0
+    for _, disponiveis in blocos:
+        total += disponiveis
+        acumulado.append(total)
+    if total < restantes:
+        return []
+
+    por_bloco = {}
+    for posicao in fluxo.amostra(total, restantes):
+        pk = blocos[bisect.bisect_right(acumulado, posicao)][0]
+        por_bloco[pk] = por_bloco.get(pk, 0) + 1
+    return list(por_bloco.items())
+
+
+def _travar_bloco(pk):
+    blocos = SorteioBloco.objects.filter(pk=pk)
+    if connection.features.has_select_for_update_skip_locked:
+        blocos = blocos.select_for_update(skip_locked=True)
+    return blocos.first()
+
+
+def _escolher_posicoes(mapa, quantidade, fluxo):
+    if fluxo is None:
+        return posicoes_disponiveis(mapa, quantidade)
+    livres = [posicao for posicao, codigo in enumerate(mapa) if codigo == DISPONIVEL]
+    if len(livres) < quantidade:
+        return []
+    return sorted(livres[i] for i in fluxo.amostra(len(livres), quantidade))
+
+
+def _gravar(bloco, posicoes, codigo, delta_disponiveis):
+    mapa = ler_mapa(bloco)
+    for posicao in posicoes:
+        mapa[posicao] = codigo
+    atualizados = (
+        SorteioBloco.objects
+        .filter(pk=bloco.pk, versao=bloco.versao)
+        .update(
+            mapa=bytes(mapa),
+            disponiveis=F("disponiveis") + delta_disponiveis,
+            versao=F("versao") + 1,
+        )
+    )
+    return atualizados == 1
+
+
+def reivindicar(bloco, posicoes, codigo):
+    """
+    Grava `codigo` nas posições livres do bloco num único UPDATE condicional.
+    Retorna False se outra transação alterou o bloco depois da leitura.
+    """
+    return _gravar(bloco, posicoes, codigo, -len(posicoes))
+
+
+def trocar_status(sorteio_id, numeros, de, para):
+    """
+    Troca o código `de` por `para` nos números dados, um UPDATE condicional por bloco.
+    Números que já não estão em `de` ficam como estão. Retorna os números alterados.
+    """
+    por_bloco = defaultdict(list)
+    for numero in numeros:
+        indice, posicao = localizar(numero)
+        por_bloco[indice].append(posicao)
+
+    # quantos números voltam (+) ou saem (-) do estoque disponível a cada troca
+    sinal = 1 if para == DISPONIVEL else -1 if de == DISPONIVEL else 0
+    alterados = []
+    with transaction.atomic():
+        for indice, posicoes in por_bloco.items():
+            for _ in range(MAX_CONFLITOS):
+                bloco = SorteioBloco.objects.select_for_update().get(sorteio_id=sorteio_id, indice=indice)
+                mapa = ler_mapa(bloco)
+                validas = [posicao for posicao in posicoes if mapa[posicao] == de]
+                if not validas:
+                    break
+                if _gravar(bloco, validas, para, sinal * len(validas)):
+                    alterados.extend(numero_de(indice, posicao) for posicao in validas)
+                    break
+            else:
+                raise AlocacaoDisputada("Sorteio muito disputado, tente novamente.")
+        ajustar_contadores(sorteio_id, de, para, len(alterados))
+        tempo_real.registrar_numeros(sorteio_id, alterados, para)
+    return alterados
+
+
+def alocar_numeros(comprar, codigo=VENDIDO, reservado_ate=None):
+    """
+    Reivindica `comprar.quantidade` números do sorteio, cria as linhas de
+    SorteioNumero correspondentes e grava a escolha em `comprar.números_escolhidos`.
+    """
+    sorteio = comprar.sorteio
+    aleatorio = sorteio.modo_alocacao == Sorteio.ModoAlocacao.ALEATORIO
+    planejar = _plano_aleatorio if aleatorio else _plano_sequencial
+    fluxo = Fluxo.do_sorteio(sorteio, f"alocacao:{comprar.pk}") if aleatorio else None
+    restantes = comprar.quantidade
+    escolhidos = []
+    disputados = set()
+    conflitos = 0
+
+    with transaction.atomic():
+        while restantes:
+            plano = planejar(sorteio, restantes, disputados, fluxo)
+            if not plano:
+                if not disputados:
+                    raise NumerosIndisponiveis("Não há números suficientes disponíveis para esta compra.")
+                # o que falta só existe em blocos disputados: tenta de novo com dados frescos
+                disputados.clear()
+                continue
+
+            for pk, quantidade in plano:
+                bloco = _travar_bloco(pk)
+                posicoes = _escolher_posicoes(ler_mapa(bloco), quantidade, fluxo) if bloco else []
+                if not posicoes or not reivindicar(bloco, posicoes, codigo):
+                    conflitos += 1
+                    if conflitos > MAX_CONFLITOS:
+                        raise AlocacaoDisputada("Sorteio muito disputado, tente novamente.")
+                    disputados.add(pk)
+                    continue
+                escolhidos.extend(numero_de(bloco.indice, posicao) for posicao in posicoes)
+                restantes -= len(posicoes)
+
+        # a restrição única (sorteio, numero) é a última barreira contra venda dupla
+        SorteioNumero.objects.bulk_create([
+            SorteioNumero(
+                sorteio_id=comprar.sorteio_id,
+                numero=numero,
+                status=CODIGO_PARA_STATUS[codigo],
+                proprietario_id=comprar.user_id,
+                reservado_até=reservado_ate,
+                comprar=comprar,
+            )
+            for numero in escolhidos
+        ])
+        comprar.números_escolhidos = sorted(escolhidos)
+        comprar.save(update_fields=["números_escolhidos"])
+        # por último, para segurar o lock da linha do sorteio o mínimo possível
+        ajustar_contadores(comprar.sorteio_id, DISPONIVEL, codigo, len(escolhidos))
+        meus_numeros.invalidar(comprar.user_id)
+        tempo_real.registrar_numeros(comprar.sorteio_id, escolhidos, codigo)
+
+    return comprar.números_escolhidos
@@ -0,0 +1,128 @@
+"""
+Apuração (sorteio dos números vencedores).
+
+Fecha as vendas, devolve as reservas ainda pendentes e sorteia por posição entre
+os vendidos: cada vencedor é o r-ésimo número vendido, com r tirado do fluxo
+"apuracao:<hash do mapa>" da semente do sorteio (services/aleatoriedade.py), que é
+revelada aqui e confere com o `hash_semente` publicado na criação. Contar os
+vendidos por bloco é um `bytes.count` por bloco e achar o r-ésimo é uma busca
+binária nos acumulados mais uma varredura dentro de um bloco, então nenhuma linha
+de SorteioNumero é carregada.
+"""
+import bisect
+import hashlib
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Comprar, Sorteio, SorteioApuracao, SorteioBloco, SorteioNumero
+from .aleatoriedade import Fluxo, semente_do_sorteio, verificar_compromisso
+from . import meus_numeros
+from .alocacao import trocar_status
+from .estoque import TAMANHO_BLOCO, VENCEDOR, VENDIDO, numero_de
+from .reservas import liberar_compras
+
+FAIXAS_PADRAO = [{"nome": "Prêmio principal", "quantidade": 1}]
+
+
+class ApuracaoInvalida(ValueError):
+    pass
+
+
+# no mapa publicado os vencedores aparecem como VENCEDOR; para refazer a apuração
+# eles voltam a contar como VENDIDO, como estavam no fechamento
+_COMO_NO_FECHAMENTO = bytes(VENDIDO if codigo == VENCEDOR else codigo for codigo in range(256))
+
+
+def _enesimo_vendido(mapa, ordem):
+    posicao = -1
+    for _ in range(ordem + 1):
+        posicao = mapa.find(VENDIDO, posicao + 1)
+    return posicao
+
+
+def escolher_vencedores(semente, mapas, quantidade):
+    """
+    Números vencedores a partir dos mapas dos blocos (em ordem de índice).
+    Retorna (hash_mapa, total_vendidos, numeros).
+    """
+    mapas = [bytes(mapa).translate(_COMO_NO_FECHAMENTO) for mapa in mapas]
+    hash_mapa = hashlib.sha256(b"".join(mapas)).hexdigest()
+    acumulado = []
+    total = 0
+    for mapa in mapas:
+        total += mapa.count(VENDIDO)
+        acumulado.append(total)
+    if total < quantidade:
+        raise ApuracaoInvalida("Há menos números vendidos do que prêmios.")
+
+    numeros = []
+    for ordem in Fluxo(semente, f"apuracao:{hash_mapa}").amostra(total, quantidade):
+        indice = bisect.bisect_right(acumulado, ordem)
+        anterior = acumulado[indice - 1] if indice else 0
+        numeros.append(numero_de(indice, _enesimo_vendido(mapas[indice], ordem - anterior)))
+    return hash_mapa, total, numeros
+
+
+def apurar(sorteio, faixas=None):
+    """Fecha o sorteio, sorteia os vencedores de cada faixa e grava a apuração."""
+    faixas = faixas or FAIXAS_PADRAO
+    quantidade = sum(int(faixa["quantidade"]) for faixa in faixas)
+
+    with transaction.atomic():
+        sorteio = Sorteio.objects.select_for_update().get(pk=sorteio.pk)
+        if sorteio.status == Sorteio.Status.DRAWN:
+            raise ApuracaoInvalida("Este sorteio já foi apurado.")
+        sorteio.status = Sorteio.Status.CLOSED
+        sorteio.save(update_fields=["status"])
+
+        # compras não pagas até o fechamento não concorrem
+        pendentes = Comprar.objects.filter(sorteio=sorteio, status=Comprar.Status.PENDING).values_list("pk", flat=True)
+        liberar_compras(list(pendentes))
+
+        mapas = list(SorteioBloco.objects.filter(sorteio=sorteio).order_by("indice").values_list("mapa", flat=True))
+        semente = semente_do_sorteio(sorteio)
+        hash_mapa, total, numeros = escolher_vencedores(semente, mapas, quantidade)
+
+        trocar_status(sorteio.pk, numeros, VENDIDO, VENCEDOR)
+        SorteioNumero.objects.filter(sorteio=sorteio, numero__in=numeros).update(status=SorteioNumero.Status.WINNER)
+        donos = {
+            numero: (comprar_id, user_id)
+            for numero, comprar_id, user_id in SorteioNumero.objects
+            .filter(sorteio=sorteio, numero__in=numeros)
+            .values_list("numero", "comprar_id", "proprietario_id")
+        }
+
+        meus_numeros.invalidar(*(user_id for _, user_id in donos.values()))
+
+        vencedores = []
+        restantes = iter(numeros)
+        for faixa in faixas:
+            for _ in range(int(faixa["quantidade"])):
+                numero = next(restantes)
+                comprar_id, user_id = donos.get(numero, (None, None))
+                vencedores.append({"faixa": faixa["nome"], "numero": numero, "comprar": comprar_id, "user": user_id})
+
+        apuracao = SorteioApuracao.objects.create(
+            sorteio=sorteio, semente=semente, hash_mapa=hash_mapa,
+            total_vendidos=total, faixas=faixas, vencedores=vencedores,
+        )
+        sorteio.status = Sorteio.Status.DRAWN
+        sorteio.semente_revelada_em = timezone.now()
+        sorteio.save(update_fields=["status", "semente_revelada_em"])
+    return apuracao
+
+
+def verificar_apuracao(apuracao, mapa):
+    """
+    Refaz a apuração a partir do mapa do sorteio (um byte por número) e compara;
+    confere também a semente revelada com o hash publicado na criação.
+    """
+    mapas = [mapa[inicio:inicio + TAMANHO_BLOCO] for inicio in range(0, len(mapa), TAMANHO_BLOCO)]
+    quantidade = sum(int(faixa["quantidade"]) for faixa in apuracao.faixas)
+    hash_mapa, _, numeros = escolher_vencedores(apuracao.semente, mapas, quantidade)
+    return (
+        verificar_compromisso(apuracao.semente, apuracao.sorteio.hash_semente)
+        and hash_mapa == apuracao.hash_mapa
+        and numeros == [v["numero"] for v in apuracao.vencedores]
+    )
@@ -0,0 +1,148 @@
+"""
+Cache das respostas públicas de sorteio (lista e detalhe).
+
+Cada escopo (a lista ou um sorteio) tem um número de versão no cache; o payload já
+renderizado fica sob (escopo, versão, variante da query string). Compras, mudanças
+de status e edições no admin incrementam a versão do sorteio e a da lista (ver
+`invalidar`), então nada precisa ser apagado. Quando a versão muda, só uma
+requisição recalcula (lock com `cache.add`); as demais servem a última versão
+pronta ou esperam o cálculo terminar, em vez de irem todas ao banco ao mesmo tempo.
+
+O backend é o alias `SORTEIO_CACHE_ALIAS` de settings.CACHES e precisa ser
+compartilhado entre os processos (Redis): as versões são incrementadas também no
+worker da fila e no comando da agenda. Com um cache por processo (locmem) a camada
+fica desligada (`ativo()` falso) e as views calculam cada resposta.
+"""
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .caches import compartilhado
+
+ESCOPO_LISTA = "lista"
+CHAVE_VERSAO = "sorteio:resposta:versao:{}"
+CHAVE_DADOS = "sorteio:resposta:{}:{}:{}"
+CHAVE_ULTIMA = "sorteio:resposta:ultima:{}:{}"
+CHAVE_CALCULO = "sorteio:resposta:calculando:{}:{}:{}"
+PRAZO_DO_CALCULO = 10
+ESPERA_MAXIMA = 2.0
+
+
+def _cache():
+    return caches[getattr(settings, "SORTEIO_CACHE_ALIAS", "default")]
+
+
+def ativo():
+    return compartilhado(getattr(settings, "SORTEIO_CACHE_ALIAS", "default"))
+
+
+def _tempo_em_cache():
+    return getattr(settings, "SORTEIO_CACHE_SEGUNDOS", 300)
+
+
+def escopo_do_sorteio(sorteio_id):
+    return f"sorteio:{sorteio_id}"
+
+
+def variante(query_string):
+    """Resumo da query string (página, ?fields=...), para separar respostas diferentes do mesmo escopo."""
+    return hashlib.sha1(query_string.encode()).hexdigest()[:12]
+
+
+def versao(escopo):
+    return _cache().get_or_set(CHAVE_VERSAO.format(escopo), 1, timeout=None)
+
+
+async def aversao(escopo):
+    return await _cache().aget_or_set(CHAVE_VERSAO.format(escopo), 1, timeout=None)
+
+
+def invalidar(*sorteio_ids):
+    """Nova versão dos sorteios e da lista, aplicada quando a transação atual confirmar."""
+    escopos = [escopo_do_sorteio(sorteio_id) for sorteio_id in set(sorteio_ids)] + [ESCOPO_LISTA]
+
+    def incrementar():
+        cache = _cache()
+        for escopo in escopos:
+            try:
+                cache.incr(CHAVE_VERSAO.format(escopo))
+            except ValueError:
+                cache.set(CHAVE_VERSAO.format(escopo), 1, timeout=None)
+    transaction.on_commit(incrementar)
+
+
+def obter(escopo, versao_atual, variante_atual, calcular):
+    """
+    (versão, payload) do escopo: o da versão dada ou, enquanto outra requisição a
+    recalcula, o da última versão pronta. `calcular()` devolve o payload novo (bytes),
+    ou None quando a resposta não deve ir para o cache (ex.: 404).
+    """
+    cache = _cache()
+    chave = CHAVE_DADOS.format(escopo, versao_atual, variante_atual)
+    payload = cache.get(chave)
+    if payload is not None:
+        return versao_atual, payload
+
+    chave_calculo = CHAVE_CALCULO.format(escopo, versao_atual, variante_atual)
+    dono = cache.add(chave_calculo, 1, timeout=PRAZO_DO_CALCULO)
+    if not dono:
+        # outra requisição já está recalculando esta versão
+        ultima = cache.get(CHAVE_ULTIMA.format(escopo, variante_atual))
+        if ultima is not None:
+            return ultima
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(0.02)
+            payload = cache.get(chave)
+            if payload is not None:
+                return versao_atual, payload
+
+    try:
+        payload = calcular()
+        if payload is not None:
+            cache.set_many(
+                {chave: payload, CHAVE_ULTIMA.format(escopo, variante_atual): (versao_atual, payload)},
+                timeout=_tempo_em_cache(),
+            )
+    finally:
+        if dono:
+            cache.delete(chave_calculo)
+    return versao_atual, payload
+
+
+async def aobter(escopo, versao_atual, variante_atual, calcular):
+    """Versão assíncrona de `obter`; `calcular` é uma corrotina."""
+    cache = _cache()
+    chave = CHAVE_DADOS.format(escopo, versao_atual, variante_atual)
+    payload = await cache.aget(chave)
+    if payload is not None:
+        return versao_atual, payload
+
+    chave_calculo = CHAVE_CALCULO.format(escopo, versao_atual, variante_atual)
+    dono = await cache.aadd(chave_calculo, 1, timeout=PRAZO_DO_CALCULO)
+    if not dono:
+        ultima = await cache.aget(CHAVE_ULTIMA.format(escopo, variante_atual))
+        if ultima is not None:
+            return ultima
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            await asyncio.sleep(0.02)
+            payload = await cache.aget(chave)
+            if payload is not None:
+                return versao_atual, payload
+
+    try:
+        payload = await calcular()
+        if payload is not None:
+            await cache.aset_many(
+                {chave: payload, CHAVE_ULTIMA.format(escopo, variante_atual): (versao_atual, payload)},
+                timeout=_tempo_em_cache(),
+            )
+    finally:
+        if dono:
+            await cache.adelete(chave_calculo)
+    return versao_atual, payload
@@ -0,0 +1,15 @@
+"""
+Quais backends de cache enxergam o que os outros processos gravam.
+
+O LocMemCache (padrão sem REDIS_URL) é por processo: o que o worker da fila ou o
+comando da agenda grava nele não chega aos processos web. Os serviços que contam
+com invalidação entre processos consultam `compartilhado()` para encurtar o prazo
+ou deixar de usar o cache nesse caso.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def compartilhado(alias="default"):
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
@@ -0,0 +1,75 @@
+"""
+Acesso em cache à configuração do site (registro único de SiteConfig).
+
+Cada processo guarda a configuração em memória e, no máximo a cada
+`SITECONFIG_CACHE_SEGUNDOS`, confere no cache compartilhado um número de versão.
+Salvar ou apagar a configuração incrementa essa versão (ver signals.py), então
+todos os workers enxergam a mudança dentro desse intervalo; no caminho quente
+da compra não há consulta nenhuma ao banco. Com um cache por processo (locmem) a
+versão não chega aos outros processos: aí cada processo relê o registro no banco
+a cada intervalo.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.models import SiteConfig
+from .caches import compartilhado
+
+CHAVE_VERSAO = "siteconfig:versao"
+CHAVE_DADOS = "siteconfig:dados:{}"
+
+_lock = threading.Lock()
+_local = {"versao": None, "config": None, "conferido_em": 0.0}
+
+
+def _versao_compartilhada():
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, 1, timeout=None)
+        versao = cache.get(CHAVE_VERSAO, 1)
+    return versao
+
+
+def _carregar(versao):
+    chave = CHAVE_DADOS.format(versao)
+    config = cache.get(chave)
+    if config is None:
+        # sem registro ainda: valores padrão do modelo, sem gravar nada
+        config = SiteConfig.objects.first() or SiteConfig()
+        cache.set(chave, config, timeout=None)
+    return config
+
+
+def obter_config():
+    """SiteConfig atual, servida da memória do processo sempre que possível."""
+    agora = time.monotonic()
+    intervalo = getattr(settings, "SITECONFIG_CACHE_SEGUNDOS", 5)
+    config = _local["config"]
+    if config is not None and agora - _local["conferido_em"] < intervalo:
+        return config
+
+    with _lock:
+        if not compartilhado():
+            _local["config"] = SiteConfig.objects.first() or SiteConfig()
+            _local["conferido_em"] = agora
+            return _local["config"]
+        versao = _versao_compartilhada()
+        if _local["config"] is None or versao != _local["versao"]:
+            _local["config"] = _carregar(versao)
+            _local["versao"] = versao
+        _local["conferido_em"] = agora
+        return _local["config"]
+
+
+def invalidar():
+    """Chamado quando a configuração muda: nova versão para todos os processos."""
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.set(CHAVE_VERSAO, 1, timeout=None)
+    with _lock:
+        _local["config"] = None
+        _local["versao"] = None
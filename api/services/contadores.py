@@ -0,0 +1,82 @@
+"""
+Contadores desnormalizados de cada sorteio (disponíveis, reservados, vendidos,
+vencedores e receita), para que barras de progresso sejam uma leitura da própria
+linha do Sorteio. São ajustados com F() dentro da transação que muda o estoque e
+podem ser reconstruídos a partir dos blocos e das linhas com `recalcular_contadores`.
+"""
+from django.db.models import Count, F, Sum
+
+from api.models import Comprar, Sorteio, SorteioBloco, SorteioNumero
+from . import cache_sorteios, tempo_real
+from .estoque import DISPONIVEL, RESERVADO, VENCEDOR, VENDIDO
+
+CAMPO_POR_CODIGO = {
+    DISPONIVEL: "qtd_disponiveis",
+    RESERVADO: "qtd_reservados",
+    VENDIDO: "qtd_vendidos",
+    VENCEDOR: "qtd_vencedores",
+}
+CAMPO_POR_STATUS = {
+    SorteioNumero.Status.RESERVED: "qtd_reservados",
+    SorteioNumero.Status.SOLD: "qtd_vendidos",
+    SorteioNumero.Status.WINNER: "qtd_vencedores",
+}
+
+
+def ajustar_contadores(sorteio_id, de, para, quantidade, receita=0):
+    """Move `quantidade` números do contador de `de` para o de `para` (códigos do estoque)."""
+    if not quantidade and not receita:
+        return
+    alteracoes = {}
+    if quantidade:
+        alteracoes[CAMPO_POR_CODIGO[de]] = F(CAMPO_POR_CODIGO[de]) - quantidade
+        alteracoes[CAMPO_POR_CODIGO[para]] = F(CAMPO_POR_CODIGO[para]) + quantidade
+    if receita:
+        alteracoes["receita"] = F("receita") + receita
+    Sorteio.objects.filter(pk=sorteio_id).update(**alteracoes)
+    cache_sorteios.invalidar(sorteio_id)
+    if quantidade:
+        tempo_real.registrar_contadores(
+            sorteio_id, {CAMPO_POR_CODIGO[de]: -quantidade, CAMPO_POR_CODIGO[para]: quantidade},
+        )
+
+
+def contar_da_origem(sorteio_id):
+    """Valores corretos dos contadores, calculados a partir dos blocos, números e compras."""
+    valores = dict.fromkeys(CAMPO_POR_CODIGO.values(), 0)
+    valores["qtd_disponiveis"] = (
+        SorteioBloco.objects.filter(sorteio_id=sorteio_id).aggregate(total=Sum("disponiveis"))["total"] or 0
+    )
+    linhas = (
+        SorteioNumero.objects
+        .filter(sorteio_id=sorteio_id)
+        .order_by()
+        .values("status")
+        .annotate(total=Count("pk"))
+    )
+    for linha in linhas:
+        valores[CAMPO_POR_STATUS[linha["status"]]] = linha["total"]
+    valores["receita"] = (
+        Comprar.objects
+        .filter(sorteio_id=sorteio_id, status=Comprar.Status.PAID)
+        .aggregate(total=Sum("total_preco"))["total"] or 0
+    )
+    return valores
+
+
+def verificar_contadores(sorteio):
+    """{campo: (gravado, correto)} para cada contador que divergiu da origem."""
+    corretos = contar_da_origem(sorteio.pk)
+    return {
+        campo: (getattr(sorteio, campo), correto)
+        for campo, correto in corretos.items()
+        if getattr(sorteio, campo) != correto
+    }
+
+
+def recalcular_contadores(sorteio):
+    valores = contar_da_origem(sorteio.pk)
+    Sorteio.objects.filter(pk=sorteio.pk).update(**valores)
+    for campo, valor in valores.items():
+        setattr(sorteio, campo, valor)
+    return valores
@@ -0,0 +1,127 @@
+"""
+Estoque compacto de números por sorteio.
+
+Cada sorteio guarda o status dos seus números em blocos de bytes (SorteioBloco),
+um byte por número. Criar um sorteio custa um único bulk_create de poucos blocos
+e consultar a disponibilidade de um número é só ler um byte.
+"""
+import re
+
+from django.db.models import Sum
+
+from api.models import Sorteio, SorteioBloco, SorteioNumero
+
+TAMANHO_BLOCO = 4096
+
+# códigos de status gravados no mapa de cada bloco
+DISPONIVEL = 0
+RESERVADO = 1
+VENDIDO = 2
+VENCEDOR = 3
+
+CODIGO_PARA_STATUS = {
+    DISPONIVEL: SorteioNumero.Status.AVAILABLE,
+    RESERVADO: SorteioNumero.Status.RESERVED,
+    VENDIDO: SorteioNumero.Status.SOLD,
+    VENCEDOR: SorteioNumero.Status.WINNER,
+}
+STATUS_PARA_CODIGO = {status: codigo for codigo, status in CODIGO_PARA_STATUS.items()}
+
+
+def localizar(numero):
+    """Retorna (indice do bloco, posição dentro do bloco) de um número (1-based)."""
+    return divmod(numero - 1, TAMANHO_BLOCO)
+
+
+def numero_de(indice, posicao):
+    return indice * TAMANHO_BLOCO + posicao + 1
+
+
+def ler_mapa(bloco):
+    """BinaryField volta como memoryview no Postgres e bytes no SQLite."""
+    return bytearray(bloco.mapa)
+
+
+def criar_estoque(sorteio: Sorteio):
+    """Cria os blocos de um sorteio novo, todos os números disponíveis."""
+    total = sorteio.numeros_totais
+    blocos = []
+    for indice, inicio in enumerate(range(0, total, TAMANHO_BLOCO)):
+        tamanho = min(TAMANHO_BLOCO, total - inicio)
+        blocos.append(SorteioBloco(sorteio=sorteio, indice=indice, mapa=bytes(tamanho), disponiveis=tamanho))
+    SorteioBloco.objects.bulk_create(blocos)
+    Sorteio.objects.filter(pk=sorteio.pk).update(qtd_disponiveis=total)
+    sorteio.qtd_disponiveis = total
+    return blocos
+
+
+def status_do_numero(sorteio, numero):
+    """Status de um número lido direto do mapa (None se o número não existe)."""
+    indice, posicao = localizar(numero)
+    mapa = (
+        SorteioBloco.objects
+        .filter(sorteio=sorteio, indice=indice)
+        .values_list("mapa", flat=True)
+        .first()
+    )
+    if mapa is None or numero < 1 or posicao >= len(mapa):
+        return None
+    return CODIGO_PARA_STATUS[mapa[posicao]]
+
+
+def esta_disponivel(sorteio, numero):
+    return status_do_numero(sorteio, numero) == SorteioNumero.Status.AVAILABLE
+
+
+def mapa_completo(sorteio_id):
+    """Um byte de status por número do sorteio, do número 1 ao último."""
+    mapas = (
+        SorteioBloco.objects
+        .filter(sorteio_id=sorteio_id)
+        .order_by("indice")
+        .values_list("mapa", flat=True)
+    )
+    return b"".join(bytes(mapa) for mapa in mapas)
+
+
+def versao_do_mapa(sorteio_id):
+    """
+    Muda sempre que algum número do sorteio muda de status (cada escrita incrementa
+    a versão de um bloco), então serve de ETag sem ler os mapas.
+    """
+    return (
+        SorteioBloco.objects
+        .filter(sorteio_id=sorteio_id)
+        .aggregate(versao=Sum("versao"))["versao"]
+    )
+
+
+async def aversao_do_mapa(sorteio_id):
+    resultado = await SorteioBloco.objects.filter(sorteio_id=sorteio_id).aaggregate(versao=Sum("versao"))
+    return resultado["versao"]
+
+
+async def amapas(sorteio_id):
+    """Mapas dos blocos em ordem, um por vez (ORM assíncrono), para streaming."""
+    mapas = SorteioBloco.objects.filter(sorteio_id=sorteio_id).order_by("indice").values_list("mapa", flat=True)
+    async for mapa in mapas:
+        yield bytes(mapa)
+
+
+_SEQUENCIA = re.compile(rb"(.)\1*", re.S)
+
+
+def codificar_rle(mapa):
+    """[[codigo, repeticoes], ...] percorrendo o mapa do número 1 em diante."""
+    return [[sequencia.group()[0], len(sequencia.group())] for sequencia in _SEQUENCIA.finditer(mapa)]
+
+
+def posicoes_disponiveis(mapa, limite):
+    """Até `limite` posições livres do mapa, em ordem crescente."""
+    posicoes = []
+    posicao = mapa.find(DISPONIVEL)
+    while posicao != -1 and len(posicoes) < limite:
+        posicoes.append(posicao)
+        posicao = mapa.find(DISPONIVEL, posicao + 1)
+    return posicoes
+
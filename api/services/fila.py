@@ -0,0 +1,130 @@
+"""
+Fila durável do pós-processamento das compras.
+
+A requisição só grava a Comprar e a TarefaCompra (mesma transação, chaveada por
+`chave_idempotencia`) e responde; o comando `processar_compras` pega tarefas em
+lotes com SKIP LOCKED, reserva os números de cada compra na sua própria transação
+e reagenda com espera crescente o que falhar. Com COMPRAS_PROCESSAMENTO="imediato"
+a tarefa roda logo após o commit, no próprio processo (desenvolvimento/testes).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import Comprar, Sorteio, TarefaCompra
+from .alocacao import AlocacaoDisputada, NumerosIndisponiveis
+from .reservas import reservar_numeros
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVAS = 5
+# tempo que um worker tem para terminar uma tarefa antes de outro poder pegá-la
+PRAZO_PROCESSAMENTO = timedelta(minutes=5)
+
+
+def enfileirar(comprar):
+    tarefa = TarefaCompra.objects.create(
+        comprar=comprar, chave_idempotencia=comprar.chave_idempotencia,
+        sorteio_id=comprar.sorteio_id, quantidade=comprar.quantidade, preco_unitario=comprar.preco_unitario,
+    )
+    if getattr(settings, "COMPRAS_PROCESSAMENTO", "fila") == "imediato":
+        transaction.on_commit(lambda: processar_tarefa(tarefa))
+    return tarefa
+
+
+def pegar_lote(tamanho):
+    """Marca até `tamanho` tarefas vencidas como PROCESSING para este worker e as devolve."""
+    agora = timezone.now()
+    with transaction.atomic():
+        disponiveis = (
+            TarefaCompra.objects
+            .filter(status__in=[TarefaCompra.Status.PENDING, TarefaCompra.Status.PROCESSING], disponivel_em__lte=agora)
+            .order_by("disponivel_em")
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            disponiveis = disponiveis.select_for_update(skip_locked=True)
+        ids = list(disponiveis.values_list("pk", flat=True)[:tamanho])
+        TarefaCompra.objects.filter(pk__in=ids).update(
+            status=TarefaCompra.Status.PROCESSING,
+            tentativas=F("tentativas") + 1,
+            disponivel_em=agora + PRAZO_PROCESSAMENTO,
+        )
+    return list(TarefaCompra.objects.filter(pk__in=ids).select_related("comprar__sorteio"))
+
+
+def _concluir(tarefa, status, erro=""):
+    TarefaCompra.objects.filter(pk=tarefa.pk).update(status=status, erro=erro, atualizado_em=timezone.now())
+    tarefa.status = status
+    tarefa.erro = erro
+
+
+def _reagendar(tarefa, comprar, exc):
+    """Devolve a tarefa à fila com espera crescente; depois de MAX_TENTATIVAS, cancela a compra."""
+    if tarefa.tentativas >= MAX_TENTATIVAS:
+        Comprar.objects.filter(pk=comprar.pk, status=Comprar.Status.PENDING).update(status=Comprar.Status.CANCELED)
+        _concluir(tarefa, TarefaCompra.Status.FAILED, repr(exc))
+    else:
+        espera = timedelta(seconds=2 ** tarefa.tentativas)
+        TarefaCompra.objects.filter(pk=tarefa.pk).update(
+            status=TarefaCompra.Status.PENDING, erro=repr(exc), disponivel_em=timezone.now() + espera,
+        )
+        tarefa.status = TarefaCompra.Status.PENDING
+    return tarefa.status
+
+
+def _restaurar_checkout(tarefa, comprar):
+    """A compra volta ao pedido gravado na tarefa, se alguém a alterou depois do checkout."""
+    if tarefa.quantidade is None:
+        return
+    checkout = {
+        "sorteio_id": tarefa.sorteio_id,
+        "quantidade": tarefa.quantidade,
+        "preco_unitario": tarefa.preco_unitario,
+        "total_preco": tarefa.preco_unitario * tarefa.quantidade,
+    }
+    alterados = [campo for campo, valor in checkout.items() if getattr(comprar, campo) != valor]
+    if alterados:
+        logger.warning("Compra %s alterada depois do checkout (%s); usando o pedido original", comprar.pk, alterados)
+        for campo in alterados:
+            setattr(comprar, campo, checkout[campo])
+        comprar.save(update_fields=alterados)
+        if "sorteio_id" in alterados:
+            comprar.sorteio = Sorteio.objects.get(pk=tarefa.sorteio_id)
+
+
+def processar_tarefa(tarefa):
+    """Reserva os números da compra da tarefa. Seguro de repetir: compra já processada é ignorada."""
+    comprar = tarefa.comprar
+    try:
+        with transaction.atomic():
+            comprar = Comprar.objects.select_for_update().select_related("sorteio").get(pk=comprar.pk)
+            if comprar.status == Comprar.Status.PENDING and not comprar.números_escolhidos:
+                _restaurar_checkout(tarefa, comprar)
+                reservar_numeros(comprar)
+    except AlocacaoDisputada as exc:
+        # perdeu a corrida por números num pico de vendas: tenta de novo mais tarde
+        return _reagendar(tarefa, comprar, exc)
+    except NumerosIndisponiveis as exc:
+        # esgotado: não adianta repetir, a compra é cancelada
+        Comprar.objects.filter(pk=comprar.pk, status=Comprar.Status.PENDING).update(status=Comprar.Status.CANCELED)
+        _concluir(tarefa, TarefaCompra.Status.FAILED, str(exc))
+        return tarefa.status
+    except Exception as exc:
+        logger.exception("Falha ao processar a compra %s", comprar.pk)
+        return _reagendar(tarefa, comprar, exc)
+
+    _concluir(tarefa, TarefaCompra.Status.DONE)
+    return tarefa.status
+
+
+def processar_lote(tamanho=100):
+    """Processa um lote de tarefas; devolve {status: quantidade}."""
+    resultado = {}
+    for tarefa in pegar_lote(tamanho):
+        status = processar_tarefa(tarefa)
+        resultado[status] = resultado.get(status, 0) + 1
+    return resultado
@@ -0,0 +1,45 @@
+"""
+Respostas guardadas por Idempotency-Key.
+
+O cliente manda o header `Idempotency-Key` (um UUID) no POST de compra; ele vira a
+`chave_idempotencia` da Comprar. Repetições com a mesma chave devolvem a resposta
+original, primeiro do cache (sem tocar no banco) e, depois que ela expira, a partir
+da Comprar já gravada; nunca passam de novo pela reserva de números.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ChaveInvalida(ValueError):
+    pass
+
+
+def ler_chave(valor):
+    try:
+        return uuid.UUID(str(valor))
+    except ValueError:
+        raise ChaveInvalida("Idempotency-Key precisa ser um UUID.")
+
+
+def _chave_cache(user_id, chave):
+    return f"idempotencia:compra:{user_id}:{chave}"
+
+
+def impressao(sorteio_id, quantidade):
+    """Resumo do pedido, para recusar a mesma chave usada com outro conteúdo."""
+    return f"{sorteio_id}:{quantidade}"
+
+
+def resposta_salva(user_id, chave):
+    """(impressao, status, dados) guardados para a chave, ou None."""
+    return cache.get(_chave_cache(user_id, chave))
+
+
+def salvar_resposta(user_id, chave, impressao_pedido, status, dados):
+    cache.set(
+        _chave_cache(user_id, chave),
+        (impressao_pedido, status, dados),
+        timeout=getattr(settings, "IDEMPOTENCIA_CACHE_SEGUNDOS", 300),
+    )
@@ -0,0 +1,97 @@
+"""
+Números de um usuário, agrupados por sorteio e comprimidos em faixas.
+
+`[1, 2, 3, 4, 77]` vira `[[1, 4], [77, 77]]`. O resultado fica em cache por usuário
+com um número de versão que é incrementado sempre que os números dele mudam
+(reserva, confirmação, liberação, apuração), então a tela "meus números" custa,
+no pior caso, uma consulta pelo índice (proprietario, sorteio, numero).
+
+A versão é incrementada no processo que mudou os números (em geral o worker da
+fila), então o cache só é usado quando é compartilhado entre processos; com o
+locmem cada requisição consulta o banco.
+"""
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db import transaction
+
+from api.models import SorteioNumero
+from .caches import compartilhado
+
+CHAVE_VERSAO = "meus_numeros:versao:{}"
+CHAVE_DADOS = "meus_numeros:{}:{}:{}"
+TEMPO_EM_CACHE = 24 * 60 * 60
+
+
+def comprimir(numeros):
+    """Números em ordem crescente -> lista de faixas [inicio, fim]."""
+    faixas = []
+    for numero in numeros:
+        if faixas and numero == faixas[-1][1] + 1:
+            faixas[-1][1] = numero
+        else:
+            faixas.append([numero, numero])
+    return faixas
+
+
+def _versao(user_id):
+    return cache.get_or_set(CHAVE_VERSAO.format(user_id), 1, timeout=None)
+
+
+def invalidar(*user_ids):
+    """Nova versão do cache dos usuários, aplicada quando a transação atual confirmar."""
+    def incrementar():
+        for user_id in set(user_ids) - {None}:
+            try:
+                cache.incr(CHAVE_VERSAO.format(user_id))
+            except ValueError:
+                cache.set(CHAVE_VERSAO.format(user_id), 1, timeout=None)
+    transaction.on_commit(incrementar)
+
+
+def _linhas(user_id, sorteio_id):
+    numeros = SorteioNumero.objects.filter(proprietario_id=user_id)
+    if sorteio_id is not None:
+        numeros = numeros.filter(sorteio_id=sorteio_id)
+    return numeros.order_by("sorteio_id", "numero").values_list("sorteio_id", "numero", "status")
+
+
+def _agrupar(linhas):
+    resultado = []
+    for sorteio, do_sorteio in groupby(linhas, key=lambda linha: linha[0]):
+        por_status = {}
+        total = 0
+        for _, numero, status in do_sorteio:
+            por_status.setdefault(status, []).append(numero)
+            total += 1
+        resultado.append({
+            "sorteio": sorteio,
+            "total": total,
+            "faixas": {status: comprimir(numeros) for status, numeros in por_status.items()},
+        })
+    return resultado
+
+
+def numeros_do_usuario(user_id, sorteio_id=None):
+    """[{"sorteio": id, "total": n, "faixas": {"sold": [[1, 40], [77, 77]], ...}}, ...]"""
+    if not compartilhado():
+        return _agrupar(_linhas(user_id, sorteio_id))
+    chave = CHAVE_DADOS.format(user_id, _versao(user_id), sorteio_id or "todos")
+    resultado = cache.get(chave)
+    if resultado is None:
+        resultado = _agrupar(_linhas(user_id, sorteio_id))
+        cache.set(chave, resultado, timeout=TEMPO_EM_CACHE)
+    return resultado
+
+
+async def anumeros_do_usuario(user_id, sorteio_id=None):
+    """Versão assíncrona (cache e ORM assíncronos) de `numeros_do_usuario`."""
+    if not compartilhado():
+        return _agrupar([linha async for linha in _linhas(user_id, sorteio_id)])
+    versao = await cache.aget_or_set(CHAVE_VERSAO.format(user_id), 1, timeout=None)
+    chave = CHAVE_DADOS.format(user_id, versao, sorteio_id or "todos")
+    resultado = await cache.aget(chave)
+    if resultado is None:
+        resultado = _agrupar([linha async for linha in _linhas(user_id, sorteio_id)])
+        await cache.aset(chave, resultado, timeout=TEMPO_EM_CACHE)
+    return resultado
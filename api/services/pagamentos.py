@@ -0,0 +1,147 @@
+"""
+Conciliação de pagamentos em lote.
+
+No checkout o servidor grava na compra pendente a referência que o provedor
+devolveu (`vincular_referencia`; o cliente não pode escolhê-la).
+Recebe confirmações do provedor como {pagamento_ref, status, pago_em} e aplica
+cada lote numa transação: uma consulta para travar as compras, reservas viram
+vendas com UPDATEs por conjunto (services/reservas.confirmar_compras) e
+cancelamentos devolvem os números ao estoque. Cada item recebe um resultado.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.models import Comprar
+from .reservas import confirmar_compras, liberar_compras
+
+PAGO = "pago"
+JA_PAGO = "ja_pago"
+CANCELADO = "cancelado"
+JA_CANCELADO = "ja_cancelado"
+EXPIRADO = "expirado"
+NAO_ENCONTRADO = "nao_encontrado"
+INVALIDO = "invalido"
+
+STATUS_ACEITOS = (Comprar.Status.PAID, Comprar.Status.CANCELED)
+
+
+class ReferenciaInvalida(ValueError):
+    pass
+
+
+def vincular_referencia(comprar, pagamento_ref, provedor=""):
+    """Grava a referência do provedor numa compra pendente. Repetir com a mesma referência não muda nada."""
+    ref = str(pagamento_ref or "").strip()
+    if not ref:
+        raise ReferenciaInvalida("Informe o pagamento_ref.")
+    with transaction.atomic():
+        comprar = Comprar.objects.select_for_update().get(pk=comprar.pk)
+        if comprar.pagamento_ref == ref:
+            return comprar
+        if comprar.status != Comprar.Status.PENDING:
+            raise ReferenciaInvalida("Só compras pendentes recebem referência de pagamento.")
+        if comprar.pagamento_ref:
+            raise ReferenciaInvalida("A compra já tem outra referência de pagamento.")
+        comprar.pagamento_ref = ref
+        campos = ["pagamento_ref"]
+        if provedor:
+            comprar.provedor_de_pagamento = provedor
+            campos.append("provedor_de_pagamento")
+        try:
+            with transaction.atomic():
+                comprar.save(update_fields=campos)
+        except IntegrityError:
+            raise ReferenciaInvalida("pagamento_ref já usado em outra compra.")
+    return comprar
+
+
+def _ler_data(valor):
+    if not valor:
+        return None
+    data = valor if hasattr(valor, "tzinfo") else parse_datetime(str(valor))
+    if data is not None and timezone.is_naive(data):
+        data = timezone.make_aware(data)
+    return data
+
+
+def aplicar_lote(itens):
+    """
+    Aplica um lote de confirmações; devolve [{"pagamento_ref", "resultado"}] na ordem
+    recebida. Itens malformados e refs repetidas no lote (vale a primeira) são `invalido`.
+    """
+    resultados = {}
+    pedidos = {}
+    saida = []  # [ref, resultado] por item; None = decidido pelo banco, em `resultados`
+    for item in itens:
+        if not isinstance(item, dict):
+            saida.append(["", INVALIDO])
+            continue
+        ref = str(item.get("pagamento_ref") or "").strip()
+        try:
+            pago_em = _ler_data(item.get("pago_em"))
+        except ValueError:
+            saida.append([ref, INVALIDO])
+            continue
+        if not ref or item.get("status") not in STATUS_ACEITOS or ref in pedidos:
+            saida.append([ref, INVALIDO])
+        else:
+            pedidos[ref] = (item["status"], pago_em)
+            saida.append([ref, None])
+
+    with transaction.atomic():
+        compras, repetidas = {}, set()
+        for comprar in (
+            Comprar.objects
+            .select_for_update(of=("self",))
+            .select_related("sorteio")
+            .filter(pagamento_ref__in=list(pedidos))
+        ):
+            if comprar.pagamento_ref in compras:
+                repetidas.add(comprar.pagamento_ref)
+            compras[comprar.pagamento_ref] = comprar
+        pagar, pagos_em, cancelar = [], {}, []
+        for ref, (status, pago_em) in pedidos.items():
+            comprar = compras.get(ref)
+            if ref in repetidas:
+                # dados anteriores à restrição de unicidade: não dá para saber qual compra é
+                resultados[ref] = INVALIDO
+            elif comprar is None:
+                resultados[ref] = NAO_ENCONTRADO
+            elif comprar.status == Comprar.Status.PAID:
+                resultados[ref] = JA_PAGO
+            elif comprar.status == Comprar.Status.CANCELED:
+                resultados[ref] = EXPIRADO if status == Comprar.Status.PAID else JA_CANCELADO
+            elif status == Comprar.Status.PAID:
+                pagar.append(comprar)
+                pagos_em[comprar.pk] = pago_em
+            else:
+                cancelar.append(comprar)
+
+        confirmadas, expiradas = confirmar_compras(pagar, pagos_em)
+        for comprar in confirmadas:
+            resultados[comprar.pagamento_ref] = PAGO
+        # reserva incompleta: devolve o que sobrou e registra para estorno
+        liberar_compras([comprar.pk for comprar in expiradas])
+        for comprar in expiradas:
+            resultados[comprar.pagamento_ref] = EXPIRADO
+        liberar_compras([comprar.pk for comprar in cancelar])
+        for comprar in cancelar:
+            resultados[comprar.pagamento_ref] = CANCELADO
+
+    return [
+        {"pagamento_ref": ref, "resultado": resultado or resultados[ref]}
+        for ref, resultado in saida
+    ]
+
+
+def aplicar_pagamentos(itens, lote=1000):
+    """Aplica um iterável (possivelmente um stream) de confirmações em lotes de `lote` itens."""
+    pendentes = []
+    for item in itens:
+        pendentes.append(item)
+        if len(pendentes) >= lote:
+            yield from aplicar_lote(pendentes)
+            pendentes = []
+    if pendentes:
+        yield from aplicar_lote(pendentes)
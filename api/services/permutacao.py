@@ -0,0 +1,38 @@
+"""
+Permutação pseudoaleatória de [0, n) definida por uma chave, calculada posição a
+posição sem materializar a lista (rede de Feistel balanceada + cycle walking).
+"""
+import hashlib
+
+RODADAS = 4
+
+
+class Permutacao:
+    def __init__(self, n, chave: bytes):
+        self.n = n
+        bits = max((n - 1).bit_length(), 2)
+        bits += bits % 2
+        self.metade = bits // 2
+        self.mascara = (1 << self.metade) - 1
+        self.chave = chave
+
+    def _rodada(self, rodada, valor):
+        digest = hashlib.blake2b(
+            f"{rodada}:{valor}".encode(), key=self.chave, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "big") & self.mascara
+
+    def _feistel(self, x):
+        esquerda, direita = x >> self.metade, x & self.mascara
+        for rodada in range(RODADAS):
+            esquerda, direita = direita, esquerda ^ self._rodada(rodada, direita)
+        return (esquerda << self.metade) | direita
+
+    def __call__(self, posicao):
+        if not 0 <= posicao < self.n:
+            raise IndexError(posicao)
+        # o domínio da rede é < 4n, então o laço dá poucas voltas em média
+        valor = self._feistel(posicao)
+        while valor >= self.n:
+            valor = self._feistel(valor)
+        return valor
@@ -0,0 +1,171 @@
+"""
+Prêmios das raspadinhas.
+
+A tabela de `SiteConfig.tabela_raspadinha` é compilada uma vez em prêmios + pesos
+acumulados e fica pronta junto da configuração em cache (services/config.py); os k prêmios de uma compra
+saem de uma única chamada ao fluxo "raspadinha:<compra>" da semente do sorteio
+(services/aleatoriedade.py) e as raspadinhas são gravadas num único bulk_create.
+
+Sorteios com `modo_premiacao = LOTE` não sorteiam nada na compra: na abertura é
+gerado um lote embaralhado com exatamente `numeros_totais` cartões (SorteioPremiacao),
+com a chave da embaralhada derivada da semente do sorteio, e cada compra paga só
+avança o cursor do lote.
+"""
+import bisect
+import itertools
+import math
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.crypto import get_random_string
+
+from api.models import Raspadinha, Sorteio, SorteioPremiacao
+from .aleatoriedade import Fluxo, derivar_chave, semente_do_sorteio
+from .config import obter_config
+from .permutacao import Permutacao
+
+
+class TabelaDePremios:
+    def __init__(self, premios, pesos):
+        self.premios = premios
+        self.acumulado = list(itertools.accumulate(pesos))
+
+    @classmethod
+    def compilar(cls, tabela):
+        """
+        Aceita itens {"premio": ..., "chance": ...} ou {"amount": ..., "prob": ...};
+        itens inválidos ou com chance <= 0 são ignorados.
+        """
+        premios, pesos = [], []
+        for item in tabela if isinstance(tabela, list) else []:
+            try:
+                premio = Decimal(str(item.get("premio", item.get("amount"))))
+                chance = float(item.get("chance", item.get("prob")))
+            except (AttributeError, TypeError, ValueError, InvalidOperation):
+                continue
+            if chance > 0:
+                premios.append(premio)
+                pesos.append(chance)
+        return cls(premios, pesos)
+
+    def __bool__(self):
+        return bool(self.premios)
+
+    def sortear(self, quantidade, fluxo):
+        """`quantidade` prêmios de uma vez (Decimal("0") se a tabela estiver vazia)."""
+        if not self.premios:
+            return [Decimal("0")] * quantidade
+        return fluxo.escolhas(self.premios, self.acumulado, quantidade)
+
+
+def tabela_de_premios():
+    """
+    Tabela compilada da configuração atual. Fica presa ao objeto devolvido por
+    `obter_config`, então é compilada uma vez por versão da configuração.
+    """
+    config = obter_config()
+    tabela = getattr(config, "_tabela_compilada", None)
+    if tabela is None:
+        tabela = config._tabela_compilada = TabelaDePremios.compilar(config.tabela_raspadinha)
+    return tabela
+
+
+def distribuir_faixas(tabela, total):
+    """
+    Quantos cartões de cada prêmio num lote de `total` cartões, proporcional às
+    chances da tabela (maiores restos); as quantidades somam exatamente `total`.
+    """
+    if not tabela:
+        return [{"premio": "0", "quantidade": total}]
+    soma = tabela.acumulado[-1]
+    anterior = 0
+    cotas = []
+    for premio, acumulado in zip(tabela.premios, tabela.acumulado):
+        cotas.append((premio, total * (acumulado - anterior) / soma))
+        anterior = acumulado
+    quantidades = [math.floor(cota) for _, cota in cotas]
+    sobra = total - sum(quantidades)
+    por_resto = sorted(range(len(cotas)), key=lambda i: cotas[i][1] - quantidades[i], reverse=True)
+    for i in por_resto[:sobra]:
+        quantidades[i] += 1
+    return [
+        {"premio": str(premio), "quantidade": quantidade}
+        for (premio, _), quantidade in zip(cotas, quantidades)
+        if quantidade
+    ]
+
+
+def gerar_premiacao(sorteio):
+    """Cria o lote de prêmios do sorteio (idempotente: devolve o existente se houver)."""
+    premiacao, _ = SorteioPremiacao.objects.get_or_create(
+        sorteio=sorteio,
+        defaults={
+            "faixas": distribuir_faixas(tabela_de_premios(), sorteio.numeros_totais),
+            "semente": derivar_chave(semente_do_sorteio(sorteio), "lote"),
+        },
+    )
+    return premiacao
+
+
+class LoteDePremios:
+    """Leitura do lote: o prêmio da posição `p` sai da permutação + quantidades por faixa."""
+
+    def __init__(self, premiacao):
+        self.premios = [Decimal(faixa["premio"]) for faixa in premiacao.faixas]
+        self.limites = list(itertools.accumulate(faixa["quantidade"] for faixa in premiacao.faixas))
+        self.permutacao = Permutacao(self.limites[-1], bytes.fromhex(premiacao.semente))
+
+    def __len__(self):
+        return self.limites[-1]
+
+    def premio(self, posicao):
+        return self.premios[bisect.bisect_right(self.limites, self.permutacao(posicao))]
+
+
+def total_do_lote(premiacao):
+    """Valor total que o lote paga se todos os cartões forem vendidos (conhecido desde a abertura)."""
+    return sum(Decimal(faixa["premio"]) * faixa["quantidade"] for faixa in premiacao.faixas)
+
+
+def retirar_do_lote(sorteio, quantidade):
+    """Avança o cursor do lote em `quantidade` e devolve os prêmios dessas posições."""
+    with transaction.atomic():
+        atualizados = (
+            SorteioPremiacao.objects
+            .filter(sorteio=sorteio, cursor__lte=sorteio.numeros_totais - quantidade)
+            .update(cursor=F("cursor") + quantidade)
+        )
+        if not atualizados:
+            raise ValueError("O lote de prêmios deste sorteio não existe ou acabou.")
+        # o UPDATE acima segura a linha até o fim da transação, então o cursor lido é o nosso
+        premiacao = SorteioPremiacao.objects.get(sorteio=sorteio)
+    lote = LoteDePremios(premiacao)
+    inicio = premiacao.cursor - quantidade
+    return [lote.premio(posicao) for posicao in range(inicio, premiacao.cursor)]
+
+
+def montar_raspadinhas(comprar):
+    """Raspadinhas (ainda não gravadas) de uma compra, uma por número, com os prêmios já definidos."""
+    if comprar.sorteio.modo_premiacao == Sorteio.ModoPremiacao.LOTE:
+        premios = retirar_do_lote(comprar.sorteio, comprar.quantidade)
+    else:
+        fluxo = Fluxo.do_sorteio(comprar.sorteio, f"raspadinha:{comprar.pk}")
+        premios = tabela_de_premios().sortear(comprar.quantidade, fluxo)
+    return [
+        Raspadinha(
+            user_id=comprar.user_id,
+            sorteio_id=comprar.sorteio_id,
+            comprar=comprar,
+            valor_premio=premio,
+            codigo=get_random_string(12).upper(),
+        )
+        for premio in premios
+    ]
+
+
+def gerar_raspadinhas(*compras):
+    """Grava as raspadinhas de uma ou mais compras num único INSERT."""
+    return Raspadinha.objects.bulk_create([
+        raspadinha for comprar in compras for raspadinha in montar_raspadinhas(comprar)
+    ])
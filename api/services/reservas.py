@@ -0,0 +1,198 @@
+"""
+Reservas de números enquanto a compra está pendente.
+
+A compra nasce PENDING com os números RESERVED até `reservado_até`. O pagamento
+confirmado vira SOLD; reservas vencidas voltam ao estoque pela varredura
+`liberar_reservas_expiradas`, que usa o índice (sorteio, status, reservado_até).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Comprar, Sorteio, SorteioNumero
+from . import meus_numeros
+from .alocacao import alocar_numeros, trocar_status
+from .contadores import ajustar_contadores
+from .premios import gerar_raspadinhas
+from .estoque import DISPONIVEL, RESERVADO, VENDIDO
+
+
+LIMITE_UPDATES_POR_DATA = 20
+
+
+class ReservaExpirada(ValueError):
+    pass
+
+
+def prazo_da_reserva(agora=None):
+    return (agora or timezone.now()) + timedelta(minutes=settings.SORTEIO_RESERVA_MINUTOS)
+
+
+def reservar_numeros(comprar):
+    return alocar_numeros(comprar, codigo=RESERVADO, reservado_ate=prazo_da_reserva())
+
+
+def confirmar_compras(compras, pagos_em=None):
+    """
+    Confirma em lote compras PENDING já travadas pelo chamador (dentro de uma transação):
+    reservas viram vendas com um UPDATE por bloco e um por tabela, e as raspadinhas
+    de todas as compras saem num único INSERT. Compras cuja reserva já não está
+    completa ficam de fora. Retorna (confirmadas, expiradas).
+    """
+    pagos_em = pagos_em or {}
+    numeros_por_compra = defaultdict(list)
+    reservados = SorteioNumero.objects.filter(
+        comprar_id__in=[comprar.pk for comprar in compras], status=SorteioNumero.Status.RESERVED
+    )
+    for comprar_id, numero in reservados.values_list("comprar_id", "numero"):
+        numeros_por_compra[comprar_id].append(numero)
+
+    confirmadas, expiradas = [], []
+    for comprar in compras:
+        completa = len(numeros_por_compra[comprar.pk]) == comprar.quantidade
+        (confirmadas if completa else expiradas).append(comprar)
+    if not confirmadas:
+        return confirmadas, expiradas
+
+    por_sorteio = defaultdict(list)
+    receita = defaultdict(Decimal)
+    for comprar in confirmadas:
+        por_sorteio[comprar.sorteio_id].extend(numeros_por_compra[comprar.pk])
+        receita[comprar.sorteio_id] += comprar.total_preco
+    for sorteio_id, numeros in por_sorteio.items():
+        trocar_status(sorteio_id, numeros, RESERVADO, VENDIDO)
+        ajustar_contadores(sorteio_id, RESERVADO, VENDIDO, 0, receita=receita[sorteio_id])
+    SorteioNumero.objects.filter(
+        comprar_id__in=[comprar.pk for comprar in confirmadas], status=SorteioNumero.Status.RESERVED
+    ).update(status=SorteioNumero.Status.SOLD, reservado_até=None)
+    meus_numeros.invalidar(*(comprar.user_id for comprar in confirmadas))
+
+    # um UPDATE por data de pagamento (no lote do provedor costumam ser poucas)
+    agora = timezone.now()
+    por_data = defaultdict(list)
+    for comprar in confirmadas:
+        comprar.status = Comprar.Status.PAID
+        comprar.pago_em = pagos_em.get(comprar.pk) or agora
+        por_data[comprar.pago_em].append(comprar.pk)
+    if len(por_data) > LIMITE_UPDATES_POR_DATA:
+        Comprar.objects.filter(pk__in=[comprar.pk for comprar in confirmadas]).update(status=Comprar.Status.PAID)
+        Comprar.objects.bulk_update(confirmadas, ["pago_em"])
+    else:
+        for pago_em, ids in por_data.items():
+            Comprar.objects.filter(pk__in=ids).update(status=Comprar.Status.PAID, pago_em=pago_em)
+    gerar_raspadinhas(*confirmadas)
+    return confirmadas, expiradas
+
+
+def confirmar_reserva(comprar, pagamento_ref="", pago_em=None):
+    """
+    Transforma a reserva de uma compra pendente em venda, marca a compra como paga
+    e gera as raspadinhas bônus.
+    """
+    with transaction.atomic():
+        comprar = (
+            Comprar.objects
+            .select_for_update(of=("self",))
+            .select_related("sorteio")
+            .get(pk=comprar.pk)
+        )
+        if comprar.status == Comprar.Status.PAID:
+            return comprar
+        if comprar.status != Comprar.Status.PENDING:
+            raise ReservaExpirada("A reserva desta compra já foi liberada.")
+        confirmadas, _ = confirmar_compras([comprar], {comprar.pk: pago_em})
+        if not confirmadas:
+            raise ReservaExpirada("A reserva desta compra já foi liberada.")
+        if pagamento_ref:
+            comprar.pagamento_ref = pagamento_ref
+            comprar.save(update_fields=["pagamento_ref"])
+    return comprar
+
+
+def liberar_compras(comprar_ids):
+    """
+    Devolve ao estoque os números reservados das compras pendentes informadas
+    e cancela essas compras. Retorna quantas compras foram canceladas.
+    """
+    with transaction.atomic():
+        travadas = list(
+            Comprar.objects
+            .select_for_update()
+            .filter(pk__in=comprar_ids, status=Comprar.Status.PENDING)
+            .values_list("pk", "user_id")
+        )
+        if not travadas:
+            return 0
+        pendentes = [pk for pk, _ in travadas]
+
+        reservados = SorteioNumero.objects.filter(comprar_id__in=pendentes, status=SorteioNumero.Status.RESERVED)
+        por_sorteio = defaultdict(list)
+        for sorteio_id, numero in reservados.values_list("sorteio_id", "numero"):
+            por_sorteio[sorteio_id].append(numero)
+        for sorteio_id, numeros in por_sorteio.items():
+            trocar_status(sorteio_id, numeros, RESERVADO, DISPONIVEL)
+
+        reservados.delete()
+        Comprar.objects.filter(pk__in=pendentes).update(status=Comprar.Status.CANCELED)
+        meus_numeros.invalidar(*(user_id for _, user_id in travadas))
+    return len(pendentes)
+
+
+def cancelar_reserva(comprar):
+    return liberar_compras([comprar.pk]) == 1
+
+
+def _liberar_orfas(sorteio_id, agora):
+    """
+    Reservas vencidas cuja compra foi apagada (SorteioNumero.comprar é SET_NULL):
+    sem compra não há o que cancelar, os números só voltam ao estoque.
+    """
+    with transaction.atomic():
+        orfas = SorteioNumero.objects.select_for_update().filter(
+            sorteio_id=sorteio_id,
+            status=SorteioNumero.Status.RESERVED,
+            reservado_até__lte=agora,
+            comprar__isnull=True,
+        )
+        linhas = list(orfas.values_list("pk", "numero", "proprietario_id"))
+        if not linhas:
+            return 0
+        trocar_status(sorteio_id, [numero for _, numero, _ in linhas], RESERVADO, DISPONIVEL)
+        SorteioNumero.objects.filter(pk__in=[pk for pk, _, _ in linhas]).delete()
+        meus_numeros.invalidar(*(user_id for _, _, user_id in linhas))
+    return len(linhas)
+
+
+def liberar_reservas_expiradas(agora=None, lote=500):
+    """
+    Libera, em lotes de compras, todas as reservas vencidas (inclusive as que ficaram
+    sem compra). Retorna quantas compras foram canceladas.
+    """
+    agora = agora or timezone.now()
+    total = 0
+    for sorteio_id in Sorteio.objects.exclude(status=Sorteio.Status.DRAWN).values_list("pk", flat=True):
+        _liberar_orfas(sorteio_id, agora)
+        while True:
+            comprar_ids = list(
+                SorteioNumero.objects
+                .filter(
+                    sorteio_id=sorteio_id,
+                    status=SorteioNumero.Status.RESERVED,
+                    reservado_até__lte=agora,
+                    comprar__isnull=False,
+                )
+                .order_by()
+                .values_list("comprar_id", flat=True)
+                .distinct()[:lote]
+            )
+            if not comprar_ids:
+                break
+            liberadas = liberar_compras(comprar_ids)
+            total += liberadas
+            if len(comprar_ids) < lote or not liberadas:
+                break
+    return total
@@ -0,0 +1,217 @@
+"""
+Deltas de disponibilidade em tempo real.
+
+Os caminhos de alocação e reserva chamam `registrar_numeros` / `registrar_contadores`
+(depois do commit). As mudanças de cada sorteio se acumulam numa janela de
+`TEMPO_REAL_JANELA_MS` e saem como uma única mensagem compacta:
+
+    {"sorteio": 7, "seq": 12, "numeros": {"sold": [[1, 40]], "available": [[77, 77]]},
+     "contadores": {"qtd_vendidos": 40, "qtd_reservados": -40}}
+
+em que `numeros` traz o status novo em faixas e `contadores` as variações somadas.
+A entrega passa pelo backend configurado em `TEMPO_REAL_BACKEND`: o local só
+alcança os assinantes deste processo; o Redis (pub/sub) alcança todos os workers.
+Como as reservas rodam no worker `processar_compras` (COMPRAS_PROCESSAMENTO="fila"),
+o backend local só entrega as reservas no modo "imediato"; `verificar_backend`
+avisa quando a combinação não funciona.
+Os assinantes (o SSE de api/v1/eventos.py) recebem as mensagens numa asyncio.Queue
+do seu event loop.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import checks
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .estoque import CODIGO_PARA_STATUS
+from .meus_numeros import comprimir
+
+logger = logging.getLogger(__name__)
+
+CANAL_REDIS = "sorteio:deltas"
+TAMANHO_DA_FILA = 256
+
+
+class Assinatura:
+    """Fila de um cliente conectado; `atrasado` fica True se ele não der conta do ritmo."""
+
+    def __init__(self, sorteio_id):
+        self.sorteio_id = sorteio_id
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=TAMANHO_DA_FILA)
+        self.atrasado = False
+
+    def _entregar(self, mensagem):
+        try:
+            self.fila.put_nowait(mensagem)
+        except asyncio.QueueFull:
+            self.atrasado = True
+
+    def entregar(self, mensagem):
+        # chamado de qualquer thread
+        self.loop.call_soon_threadsafe(self._entregar, mensagem)
+
+
+class Assinantes:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_sorteio = defaultdict(set)
+
+    def adicionar(self, assinatura):
+        with self._lock:
+            self._por_sorteio[assinatura.sorteio_id].add(assinatura)
+
+    def remover(self, assinatura):
+        with self._lock:
+            self._por_sorteio[assinatura.sorteio_id].discard(assinatura)
+            if not self._por_sorteio[assinatura.sorteio_id]:
+                del self._por_sorteio[assinatura.sorteio_id]
+
+    def entregar(self, mensagem):
+        with self._lock:
+            destinos = list(self._por_sorteio.get(mensagem["sorteio"], ()))
+        for assinatura in destinos:
+            if not assinatura.loop.is_closed():
+                assinatura.entregar(mensagem)
+
+
+assinantes = Assinantes()
+
+
+class BackendLocal:
+    """Entrega só aos assinantes deste processo."""
+
+    def publicar(self, mensagem):
+        assinantes.entregar(mensagem)
+
+
+class BackendRedis:
+    """Pub/sub no REDIS_URL: cada worker publica no canal e entrega o que ouve dele."""
+
+    def __init__(self):
+        import redis
+
+        self.redis = redis.Redis.from_url(settings.REDIS_URL)
+        threading.Thread(target=self._ouvir, name="tempo-real-redis", daemon=True).start()
+
+    def publicar(self, mensagem):
+        self.redis.publish(CANAL_REDIS, json.dumps(mensagem))
+
+    def _ouvir(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(CANAL_REDIS)
+        for item in pubsub.listen():
+            try:
+                assinantes.entregar(json.loads(item["data"]))
+            except (TypeError, ValueError):
+                logger.warning("Mensagem de tempo real inválida: %r", item.get("data"))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            caminho = getattr(settings, "TEMPO_REAL_BACKEND", "api.services.tempo_real.BackendLocal")
+            _backend = import_string(caminho)()
+        return _backend
+
+
+def verificar_backend(app_configs=None, **kwargs):
+    """System check: backend local com a fila em outro processo não entrega as reservas."""
+    caminho = getattr(settings, "TEMPO_REAL_BACKEND", "api.services.tempo_real.BackendLocal")
+    if (
+        import_string(caminho) is BackendLocal
+        and getattr(settings, "COMPRAS_PROCESSAMENTO", "fila") == "fila"
+    ):
+        return [checks.Warning(
+            "TEMPO_REAL_BACKEND é o BackendLocal, mas as reservas rodam no worker processar_compras: "
+            "os clientes do SSE não vão receber os deltas de reserva e venda.",
+            hint="Defina REDIS_URL (usa o BackendRedis) ou COMPRAS_PROCESSAMENTO='imediato'.",
+            id="api.W001",
+        )]
+    return []
+
+
+class Agregador:
+    """Junta as mudanças de cada sorteio e publica uma mensagem por sorteio a cada janela."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._numeros = defaultdict(dict)
+        self._contadores = defaultdict(lambda: defaultdict(int))
+        self._agendado = False
+        self._seq = itertools.count(1)
+
+    def adicionar_numeros(self, sorteio_id, numeros, status):
+        with self._lock:
+            pendentes = self._numeros[sorteio_id]
+            for numero in numeros:
+                pendentes[numero] = status
+            self._agendar()
+
+    def adicionar_contadores(self, sorteio_id, variacoes):
+        with self._lock:
+            pendentes = self._contadores[sorteio_id]
+            for campo, variacao in variacoes.items():
+                pendentes[campo] += variacao
+            self._agendar()
+
+    def _agendar(self):
+        if not self._agendado:
+            self._agendado = True
+            janela = getattr(settings, "TEMPO_REAL_JANELA_MS", 250) / 1000
+            temporizador = threading.Timer(janela, self.publicar)
+            temporizador.daemon = True
+            temporizador.start()
+
+    def publicar(self):
+        with self._lock:
+            numeros, self._numeros = self._numeros, defaultdict(dict)
+            contadores, self._contadores = self._contadores, defaultdict(lambda: defaultdict(int))
+            self._agendado = False
+        for sorteio_id in set(numeros) | set(contadores):
+            por_status = defaultdict(list)
+            for numero, status in sorted(numeros.get(sorteio_id, {}).items()):
+                por_status[status].append(numero)
+            mensagem = {
+                "sorteio": sorteio_id,
+                "seq": next(self._seq),
+                "numeros": {status: comprimir(lista) for status, lista in por_status.items()},
+                "contadores": {campo: variacao for campo, variacao in contadores.get(sorteio_id, {}).items() if variacao},
+            }
+            try:
+                backend().publicar(mensagem)
+            except Exception:
+                # tempo real é melhor esforço: nunca derruba quem vendeu o número
+                logger.exception("Falha ao publicar deltas do sorteio %s", sorteio_id)
+
+
+agregador = Agregador()
+
+
+def _ativo():
+    return getattr(settings, "TEMPO_REAL_ATIVO", True)
+
+
+def registrar_numeros(sorteio_id, numeros, codigo):
+    """Números que passaram para `codigo` (código do estoque), publicados depois do commit."""
+    if numeros and _ativo():
+        numeros = list(numeros)
+        transaction.on_commit(
+            lambda: agregador.adicionar_numeros(sorteio_id, numeros, CODIGO_PARA_STATUS[codigo])
+        )
+
+
+def registrar_contadores(sorteio_id, variacoes):
+    if variacoes and _ativo():
+        transaction.on_commit(lambda: agregador.adicionar_contadores(sorteio_id, variacoes))
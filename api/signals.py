@@ -1,81 +1,41 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Comprar, SorteioNumero,Sorteio, Raspadinha,SiteConfig
 from django.db import transaction
-from django.utils.crypto import get_random_string
-import random
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Comprar, Sorteio, SiteConfig
+from .services import agenda, aleatoriedade, cache_sorteios, config
+from .services.estoque import criar_estoque
+from .services.fila import enfileirar
 
 
 @receiver(post_save, sender=Sorteio)
 def criar_numeros_automaticamente(sender, instance, created, **kwargs):
     if created:
-        # Exemplo: cria números de 1 até quantidade_numeros
-        quantidade = instance.numeros_totais  
-        numeros = [
-            SorteioNumero(sorteio=instance, numero=i)
-            for i in range(1, quantidade + 1)
-        ]
-        SorteioNumero.objects.bulk_create(numeros)
-
-def sortear_premio(tabela):
-    if not tabela or not isinstance(tabela, list):
-        return 0
-
-    # Filtra apenas os itens válidos
-    premios = []
-    chances = []
-    for item in tabela:
-        try:
-            premios.append(item["premio"])
-            chances.append(item["chance"])
-        except KeyError:
-            continue  # ignora se não tiver a chave correta
-
-    # Se não tiver valores válidos, retorna 0
-    if not premios or not chances:
-        return 0
-
-    # Sorteio ponderado
-    return random.choices(premios, weights=chances, k=1)[0]
+        # Estoque compacto: poucos blocos de bytes em vez de uma linha por número
+        criar_estoque(instance)
+        # semente do sorteio: o hash fica público antes da primeira venda
+        aleatoriedade.comprometer(instance)
+    if instance.status == Sorteio.Status.SELLING:
+        # ganchos da abertura (lote de prêmios das raspadinhas)
+        agenda.ao_abrir(instance)
+    # status no cache para a compra recusar sorteios fechados sem ler o banco
+    transaction.on_commit(lambda: agenda.publicar_status(instance))
+    # respostas em cache da lista e do detalhe (admin, status, apuração)
+    cache_sorteios.invalidar(instance.pk)
+
+@receiver(post_delete, sender=Sorteio)
+def invalidar_respostas_do_sorteio(sender, instance, **kwargs):
+    cache_sorteios.invalidar(instance.pk)
 
 @receiver(post_save, sender=Comprar)
 def criar_numeros_e_raspadinhas(sender, instance: Comprar, created, **kwargs):
 
     if created:
-        quantidade = instance.quantidade
-        sorteio = instance.sorteio
-        user = instance.user
-
-        with transaction.atomic():
-            numeros_disponiveis = (
-            SorteioNumero.objects
-            .select_for_update(skip_locked=True)
-            .filter(sorteio=sorteio, status=SorteioNumero.Status.AVAILABLE)
-            .order_by("numero")[:quantidade]
-        )
-
-
-
-        if numeros_disponiveis.count() < quantidade:
-            raise ValueError("Não há números suficientes disponíveis para esta compra.")
-
-        for numero in numeros_disponiveis:
-            numero.status = SorteioNumero.Status.SOLD
-            numero.proprietario = user
-            numero.comprar = instance
-            #numero.save()
-
-        # Configuração de raspadinha
-        config = SiteConfig.objects.first()
-        tabela = config.tabela_raspadinha if config and config.tabela_raspadinha else []
-
-        for i in range(quantidade):
-            premio = sortear_premio(tabela)
-            print(f"Prêmio sorteado: {premio}")
-            #Raspadinha.objects.create(
-            #    comprar=instance,
-            #    sorteio=sorteio,
-            #    user=user,
-            #    valor_premio=premio,
-            #    codigo=get_random_string(12).upper(),
-            #)
\ No newline at end of file
+        # a reserva dos números roda no worker da fila (services/fila.py);
+        # as raspadinhas são geradas na confirmação do pagamento (services/reservas.py)
+        enfileirar(instance)
+
+@receiver([post_save, post_delete], sender=SiteConfig)
+def invalidar_config(sender, **kwargs):
+    # só depois do commit: antes disso outro worker recarregaria a linha antiga
+    # e a guardaria sob a versão nova
+    transaction.on_commit(config.invalidar)
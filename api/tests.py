@@ -1,3 +1,293 @@
-from django.test import TestCase
+import uuid
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.test import AsyncClient, RequestFactory, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .instrumentacao import limite_de_consultas
+from .models import Comprar, Raspadinha, SiteConfig, Sorteio, SorteioNumero, User
+from .services import config
+from .services.fila import processar_lote
+from .services.reservas import liberar_reservas_expiradas
+
+
+class OrcamentoDeConsultasTests(APITestCase):
+    """Limites de consultas SQL das listagens: um N+1 novo quebra estes testes."""
+
+    TOTAL = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user(username="comprador", email="c@exemplo.com", password="x", cpf="1")
+        sorteios = [
+            Sorteio.objects.create(titulo=f"Sorteio {i}", numeros_totais=1000, preco_por_numero=Decimal("2.00"))
+            for i in range(3)
+        ]
+        # bulk_create não dispara o signal que enfileira a reserva
+        compras = Comprar.objects.bulk_create([
+            Comprar(
+                user=cls.usuario, sorteio=sorteios[i % len(sorteios)], quantidade=1,
+                preco_unitario=Decimal("2.00"), total_preco=Decimal("2.00"),
+            )
+            for i in range(cls.TOTAL)
+        ])
+        Raspadinha.objects.bulk_create([
+            Raspadinha(user=cls.usuario, sorteio=compra.sorteio, comprar=compra) for compra in compras
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.usuario)
+
+    def test_lista_de_compras(self):
+        with limite_de_consultas(4):
+            resposta = self.client.get("/api/v1/compras/", {"page_size": self.TOTAL})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data["results"]), self.TOTAL)
+
+    def test_lista_de_raspadinhas_com_compra_expandida(self):
+        with limite_de_consultas(4):
+            resposta = self.client.get("/api/v1/raspadinhas/", {"page_size": self.TOTAL, "expand": "comprar"})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data["results"]), self.TOTAL)
+        self.assertEqual(resposta.data["results"][0]["comprar"]["user"]["username"], "comprador")
+
+    def test_lista_de_sorteios(self):
+        with limite_de_consultas(3):
+            resposta = self.client.get("/api/v1/sorteios/")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()["count"], 3)
+
+
+class CompraTestMixin:
+    """Sorteio à venda e um comprador autenticado; `comprar()` passa pelo POST e pelo worker da fila."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user(username="comprador", email="c@exemplo.com", password="x", cpf="1")
+        self.staff = User.objects.create_user(
+            username="admin", email="a@exemplo.com", password="x", cpf="2", is_staff=True,
+        )
+        self.sorteio = Sorteio.objects.create(
+            titulo="Sorteio", numeros_totais=100, preco_por_numero=Decimal("2.00"), status=Sorteio.Status.SELLING,
+        )
+        self.client.force_authenticate(self.usuario)
+
+    def comprar(self, quantidade=3, **headers):
+        resposta = self.client.post(
+            "/api/v1/compras/", {"sorteio_id": self.sorteio.pk, "quantidade": quantidade}, format="json", headers=headers,
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        return Comprar.objects.get(pk=resposta.json()["id"])
+
+    def contadores(self):
+        self.sorteio.refresh_from_db()
+        return self.sorteio.qtd_disponiveis, self.sorteio.qtd_reservados
+
+
+class ReservasTests(CompraTestMixin, APITestCase):
+    def test_comprador_nao_apaga_compra(self):
+        comprar = self.comprar()
+        processar_lote()
+        resposta = self.client.delete(f"/api/v1/compras/{comprar.pk}/")
+        self.assertEqual(resposta.status_code, 403)
+        self.assertEqual(self.contadores(), (97, 3))
+
+    def test_staff_apaga_compra_e_libera_reserva(self):
+        comprar = self.comprar()
+        processar_lote()
+        self.client.force_authenticate(self.staff)
+        resposta = self.client.delete(f"/api/v1/compras/{comprar.pk}/")
+        self.assertEqual(resposta.status_code, 204)
+        self.assertEqual(self.contadores(), (100, 0))
+
+    def test_varredura_libera_reserva_sem_compra(self):
+        comprar = self.comprar()
+        processar_lote()
+        # apagada fora da API (admin, shell): os números ficam sem compra
+        comprar.delete()
+        self.assertEqual(SorteioNumero.objects.filter(comprar__isnull=True).count(), 3)
+        liberar_reservas_expiradas(agora=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.contadores(), (100, 0))
+        self.assertFalse(SorteioNumero.objects.exists())
+
+
+class ContadoresTests(CompraTestMixin, APITestCase):
+    def test_save_completo_nao_apaga_incrementos(self):
+        carregado = Sorteio.objects.get(pk=self.sorteio.pk)
+        self.comprar()
+        processar_lote()
+        carregado.titulo = "Outro título"
+        carregado.save()
+        self.client.force_authenticate(self.staff)
+        resposta = self.client.patch(f"/api/v1/sorteios/{self.sorteio.pk}/", {"regras": "novas"}, format="json")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.contadores(), (97, 3))
+        self.assertEqual(self.sorteio.titulo, "Outro título")
+
+    def test_admin_nao_edita_contadores(self):
+        request = RequestFactory().get("/admin/")
+        request.user = self.staff
+        form = site._registry[Sorteio].get_form(request)
+        self.assertFalse(set(Sorteio.CONTADORES) & set(form.base_fields))
+
+
+@override_settings(SITECONFIG_CACHE_SEGUNDOS=0)
+class SiteConfigTests(APITestCase):
+    def test_mudanca_feita_por_outro_processo_chega_com_cache_local(self):
+        SiteConfig.objects.create(valor_min_de_saque=Decimal("10.00"))
+        self.assertEqual(config.obter_config().valor_min_de_saque, Decimal("10.00"))
+        # outro processo: grava sem passar pelo signal deste
+        SiteConfig.objects.update(valor_min_de_saque=Decimal("25.00"))
+        self.assertEqual(config.obter_config().valor_min_de_saque, Decimal("25.00"))
+
+
+class CheckoutTests(CompraTestMixin, APITestCase):
+    def test_comprador_nao_altera_compra(self):
+        comprar = self.comprar(quantidade=1)
+        resposta = self.client.patch(f"/api/v1/compras/{comprar.pk}/", {"quantidade": 60}, format="json")
+        self.assertEqual(resposta.status_code, 403)
+
+    def test_staff_nao_altera_quantidade_nem_sorteio(self):
+        comprar = self.comprar(quantidade=1)
+        outro = Sorteio.objects.create(
+            titulo="Outro", numeros_totais=100, preco_por_numero=Decimal("1.00"), status=Sorteio.Status.SELLING,
+        )
+        self.client.force_authenticate(self.staff)
+        resposta = self.client.patch(
+            f"/api/v1/compras/{comprar.pk}/", {"quantidade": 60, "sorteio_id": outro.pk}, format="json",
+        )
+        self.assertEqual(resposta.status_code, 200)
+        comprar.refresh_from_db()
+        self.assertEqual((comprar.sorteio_id, comprar.quantidade), (self.sorteio.pk, 1))
+
+    def test_worker_reserva_o_pedido_do_checkout(self):
+        comprar = self.comprar(quantidade=1)
+        # alterada fora da API antes do worker rodar
+        Comprar.objects.filter(pk=comprar.pk).update(quantidade=60)
+        processar_lote()
+        comprar.refresh_from_db()
+        self.assertEqual((comprar.quantidade, comprar.total_preco), (1, Decimal("2.00")))
+        self.assertEqual(self.contadores(), (99, 1))
+
+
+class IdempotenciaTests(CompraTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.chave = str(uuid.uuid4())
+
+    def test_repeticao_depois_do_cache_devolve_a_compra_original(self):
+        comprar = self.comprar(**{"Idempotency-Key": self.chave})
+        cache.clear()
+        Sorteio.objects.filter(pk=self.sorteio.pk).update(status=Sorteio.Status.CLOSED)
+        with self.assertNumQueries(1):
+            resposta = self.client.post(
+                "/api/v1/compras/", {"sorteio_id": self.sorteio.pk, "quantidade": 3},
+                format="json", headers={"Idempotency-Key": self.chave},
+            )
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(resposta.json()["id"], comprar.pk)
+        self.assertEqual(Comprar.objects.count(), 1)
+
+    def test_repeticao_com_outro_pedido(self):
+        self.comprar(**{"Idempotency-Key": self.chave})
+        cache.clear()
+        resposta = self.client.post(
+            "/api/v1/compras/", {"sorteio_id": self.sorteio.pk, "quantidade": 5},
+            format="json", headers={"Idempotency-Key": self.chave},
+        )
+        self.assertEqual(resposta.status_code, 422)
+
+    def test_chave_de_outro_usuario(self):
+        self.comprar(**{"Idempotency-Key": self.chave})
+        self.client.force_authenticate(self.staff)
+        resposta = self.client.post(
+            "/api/v1/compras/", {"sorteio_id": self.sorteio.pk, "quantidade": 3},
+            format="json", headers={"Idempotency-Key": self.chave},
+        )
+        self.assertEqual(resposta.status_code, 409)
+
+
+class ConciliacaoTests(CompraTestMixin, APITestCase):
+    def vincular(self, comprar, ref):
+        self.client.force_authenticate(self.staff)
+        return self.client.post(
+            f"/api/v1/compras/{comprar.pk}/vincular_pagamento/",
+            {"pagamento_ref": ref, "provedor_de_pagamento": "pix"}, format="json",
+        )
+
+    def test_concilia_compra_pendente(self):
+        comprar = self.comprar()
+        processar_lote()
+        self.assertEqual(self.vincular(comprar, "pix-123").status_code, 200)
+        resposta = self.client.post(
+            "/api/v1/compras/pagamentos/", [{"pagamento_ref": "pix-123", "status": "paid"}], format="json",
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["resultados"], [{"pagamento_ref": "pix-123", "resultado": "pago"}])
+        comprar.refresh_from_db()
+        self.assertEqual(comprar.status, Comprar.Status.PAID)
+        self.sorteio.refresh_from_db()
+        self.assertEqual((self.sorteio.qtd_reservados, self.sorteio.qtd_vendidos), (0, 3))
+
+    def test_referencia_nao_se_repete(self):
+        primeira, segunda = self.comprar(), self.comprar()
+        self.assertEqual(self.vincular(primeira, "pix-123").status_code, 200)
+        self.assertEqual(self.vincular(segunda, "pix-123").status_code, 409)
+        self.assertEqual(self.vincular(primeira, "pix-123").status_code, 200)
+
+    def test_comprador_nao_vincula_referencia(self):
+        comprar = self.comprar()
+        resposta = self.client.post(
+            f"/api/v1/compras/{comprar.pk}/vincular_pagamento/", {"pagamento_ref": "pix-123"}, format="json",
+        )
+        self.assertEqual(resposta.status_code, 403)
+
+
+class ExportacaoTests(CompraTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        Comprar.objects.bulk_create([
+            Comprar(
+                user=self.usuario, sorteio=self.sorteio, quantidade=1,
+                preco_unitario=Decimal("2.00"), total_preco=Decimal("2.00"),
+            )
+            for _ in range(5)
+        ])
+
+    def test_exporta_csv_em_streaming(self):
+        resposta = self.client.get("/api/v1/compras/", {"format": "csv"})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.streaming)
+        linhas = b"".join(resposta.streaming_content).decode().splitlines()
+        self.assertEqual(len(linhas), 6)
+        self.assertTrue(linhas[0].startswith("id,"))
+
+    async def test_exporta_ndjson_com_corpo_assincrono_sob_asgi(self):
+        resposta = await AsyncClient().get(
+            "/api/v1/compras/", {"format": "ndjson"},
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.usuario)}"},
+        )
+        self.assertEqual(resposta.status_code, 200)
+        # com um gerador síncrono o Django juntaria a exportação inteira na memória
+        self.assertTrue(resposta.is_async)
+        corpo = b"".join([pedaco async for pedaco in resposta.streaming_content])
+        self.assertEqual(len(corpo.splitlines()), 5)
+
+
+class EventosTests(APITestCase):
+    def test_sse_recusado_sob_wsgi(self):
+        sorteio = Sorteio.objects.create(titulo="Sorteio", numeros_totais=10, preco_por_numero=Decimal("2.00"))
+        resposta = self.client.get(f"/api/v1/sorteios/{sorteio.pk}/eventos/")
+        self.assertEqual(resposta.status_code, 501)
+        self.assertFalse(resposta.streaming)
+
+    async def test_sorteio_inexistente_sob_asgi(self):
+        resposta = await AsyncClient().get("/api/v1/sorteios/999/eventos/")
+        self.assertEqual(resposta.status_code, 404)
@@ -0,0 +1,167 @@
+"""
+Versões assíncronas das leituras mais acessadas, para rodar sob o Backend/asgi.py.
+
+    GET /api/v1/async/sorteios/              lista paginada (JSON em streaming, ?page= e ?status=)
+    GET /api/v1/async/sorteios/<id>/         detalhe (mesmo cache/ETag da viewset)
+    GET /api/v1/async/sorteios/<id>/mapa/    disponibilidade (bytes ou ?formato=rle)
+    GET /api/v1/async/me/numeros/            números do usuário (?sorteio=)
+
+Usam o ORM e o cache assíncronos e devolvem corpos em streaming, então um cliente
+lento ocupa só uma corrotina do worker, não uma thread. As respostas têm o mesmo
+formato das rotas síncronas equivalentes.
+"""
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse,
+)
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from api.models import Sorteio
+from api.services import cache_sorteios, meus_numeros
+from api.services.estoque import CODIGO_PARA_STATUS, amapas, aversao_do_mapa, codificar_rle
+from .serializers import SorteioListSerializer, SorteioSerializer
+
+
+def _nao_modificado(request, etag):
+    if etag not in request.headers.get("If-None-Match", ""):
+        return None
+    resposta = HttpResponseNotModified()
+    resposta["ETag"] = etag
+    return resposta
+
+
+def _pagina(request, numero, total, tamanho):
+    url = request.build_absolute_uri()
+    anterior = None
+    if numero > 1:
+        anterior = remove_query_param(url, "page") if numero == 2 else replace_query_param(url, "page", numero - 1)
+    proxima = replace_query_param(url, "page", numero + 1) if numero * tamanho < total else None
+    return proxima, anterior
+
+
+async def _lista(request, sorteios, total, proxima, anterior):
+    renderer = JSONRenderer()
+    cabecalho = renderer.render({"count": total, "next": proxima, "previous": anterior})
+    yield cabecalho[:-1] + b',"results":['
+    primeiro = True
+    async for sorteio in sorteios:
+        dados = SorteioListSerializer(sorteio, context={"request": request}).data
+        yield (b"" if primeiro else b",") + renderer.render(dados)
+        primeiro = False
+    yield b"]}"
+
+
+async def sorteios(request):
+    """Mesmo envelope da paginação por página das rotas síncronas ({count, next, previous, results})."""
+    sorteios = Sorteio.objects.order_by("-criado_em")
+    if request.GET.get("status"):
+        sorteios = sorteios.filter(status=request.GET["status"])
+    tamanho = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    pagina = request.GET.get("page", "1")
+    if not pagina.isdigit() or int(pagina) < 1:
+        raise Http404("Página inválida.")
+    numero = int(pagina)
+    total = await sorteios.acount()
+    if numero > 1 and (numero - 1) * tamanho >= total:
+        raise Http404("Página inválida.")
+    proxima, anterior = _pagina(request, numero, total, tamanho)
+    inicio = (numero - 1) * tamanho
+    return StreamingHttpResponse(
+        _lista(request, sorteios[inicio:inicio + tamanho], total, proxima, anterior),
+        content_type="application/json",
+    )
+
+
+async def sorteio(request, pk):
+    async def calcular():
+        encontrado = await Sorteio.objects.select_related("criado_por").filter(pk=pk).afirst()
+        if encontrado is None:
+            return None
+        return JSONRenderer().render(SorteioSerializer(encontrado, context={"request": request}).data)
+
+    if not cache_sorteios.ativo():
+        payload = await calcular()
+        if payload is None:
+            raise Http404("Sorteio não encontrado.")
+        return HttpResponse(payload, content_type="application/json")
+
+    escopo = cache_sorteios.escopo_do_sorteio(pk)
+    variante = cache_sorteios.variante(request.META.get("QUERY_STRING", ""))
+    versao = await cache_sorteios.aversao(escopo)
+    nao_modificado = _nao_modificado(request, f'W/"{escopo}-{versao}-{variante}"')
+    if nao_modificado:
+        return nao_modificado
+
+    versao, payload = await cache_sorteios.aobter(escopo, versao, variante, calcular)
+    if payload is None:
+        raise Http404("Sorteio não encontrado.")
+    resposta = HttpResponse(payload, content_type="application/json")
+    resposta["ETag"] = f'W/"{escopo}-{versao}-{variante}"'
+    return resposta
+
+
+async def _gzip(blocos):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for bloco in blocos:
+        comprimido = compressor.compress(bloco)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
+
+
+async def mapa(request, pk):
+    """Mesmo conteúdo e ETag de /sorteios/<id>/mapa/, com o mapa enviado bloco a bloco."""
+    if not await Sorteio.objects.filter(pk=pk).aexists():
+        raise Http404("Sorteio não encontrado.")
+    formato = request.GET.get("formato", "binario")
+    etag = f'W/"{pk}-{await aversao_do_mapa(pk) or 0}-{formato}"'
+    nao_modificado = _nao_modificado(request, etag)
+    if nao_modificado:
+        return nao_modificado
+
+    if formato == "rle":
+        completo = b"".join([bloco async for bloco in amapas(pk)])
+        resposta = JsonResponse({
+            "codigos": {codigo: status for codigo, status in CODIGO_PARA_STATUS.items()},
+            "sequencias": codificar_rle(completo),
+        })
+    elif "gzip" in request.headers.get("Accept-Encoding", ""):
+        resposta = StreamingHttpResponse(_gzip(amapas(pk)), content_type="application/octet-stream")
+        resposta["Content-Encoding"] = "gzip"
+        resposta["Vary"] = "Accept-Encoding"
+    else:
+        resposta = StreamingHttpResponse(amapas(pk), content_type="application/octet-stream")
+        resposta["Vary"] = "Accept-Encoding"
+    resposta["ETag"] = etag
+    return resposta
+
+
+async def _usuario(request):
+    """Usuário da sessão ou do token JWT (a validação do token consulta o banco numa thread)."""
+    usuario = await request.auser()
+    if usuario.is_authenticated:
+        return usuario
+    try:
+        autenticado = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return autenticado[0] if autenticado else None
+
+
+async def numeros_do_usuario(request):
+    usuario = await _usuario(request)
+    if usuario is None:
+        return JsonResponse({"detail": "As credenciais de autenticação não foram fornecidas."}, status=401)
+    sorteio_id = request.GET.get("sorteio")
+    if sorteio_id is not None and not sorteio_id.isdigit():
+        return JsonResponse({"sorteio": ["Informe o id do sorteio."]}, status=400)
+    dados = await meus_numeros.anumeros_do_usuario(usuario.pk, int(sorteio_id) if sorteio_id else None)
+    return HttpResponse(json.dumps(dados, separators=(",", ":")), content_type="application/json")
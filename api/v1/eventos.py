@@ -0,0 +1,71 @@
+"""
+Server-Sent Events com os deltas de disponibilidade de um sorteio.
+
+    GET /api/v1/sorteios/<id>/eventos/
+
+A view é assíncrona: servida pelo Backend/asgi.py, cada cliente conectado é só
+uma corrotina esperando a sua fila (services/tempo_real.py), sem prender thread.
+Sob WSGI (Backend/wsgi.py, runserver) o Django juntaria o fluxo, que nunca acaba,
+numa lista presa a uma thread; por isso ali a rota responde 501.
+O primeiro evento (`estado`) traz os contadores atuais; os seguintes (`delta`),
+as mudanças agrupadas por janela. O mapa completo continua em /sorteios/<id>/mapa/.
+"""
+import asyncio
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+
+from api.models import Sorteio
+from api.services.tempo_real import Assinatura, assinantes
+
+INTERVALO_KEEPALIVE = 15
+
+
+def _evento(nome, dados):
+    return f"event: {nome}\ndata: {json.dumps(dados, separators=(',', ':'))}\n\n"
+
+
+async def _fluxo(sorteio):
+    assinatura = Assinatura(sorteio.pk)
+    assinantes.adicionar(assinatura)
+    try:
+        yield "retry: 3000\n\n"
+        yield _evento("estado", {
+            "sorteio": sorteio.pk,
+            "status": sorteio.status,
+            "contadores": {
+                "qtd_disponiveis": sorteio.qtd_disponiveis,
+                "qtd_reservados": sorteio.qtd_reservados,
+                "qtd_vendidos": sorteio.qtd_vendidos,
+                "qtd_vencedores": sorteio.qtd_vencedores,
+            },
+        })
+        while not assinatura.atrasado:
+            try:
+                mensagem = await asyncio.wait_for(assinatura.fila.get(), timeout=INTERVALO_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _evento("delta", mensagem)
+        # cliente lento perdeu mensagens: ele recarrega o estado e reconecta
+        yield _evento("recarregar", {"sorteio": sorteio.pk})
+    finally:
+        assinantes.remover(assinatura)
+
+
+async def eventos_do_sorteio(request, pk):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "Eventos em tempo real exigem o servidor ASGI (Backend.asgi:application)."},
+            status=501,
+        )
+    sorteio = await Sorteio.objects.filter(pk=pk).only(
+        "status", "qtd_disponiveis", "qtd_reservados", "qtd_vendidos", "qtd_vencedores",
+    ).afirst()
+    if sorteio is None:
+        raise Http404("Sorteio não encontrado.")
+    resposta = StreamingHttpResponse(_fluxo(sorteio), content_type="text/event-stream")
+    resposta["Cache-Control"] = "no-cache"
+    resposta["X-Accel-Buffering"] = "no"
+    return resposta
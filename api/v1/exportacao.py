@@ -0,0 +1,112 @@
+"""
+Exportação em streaming das listagens (`?format=ndjson` ou `?format=csv`).
+
+A resposta é gerada linha a linha a partir de `.iterator(chunk_size=...)`, então
+a memória do worker não cresce com o tamanho da exportação. Sob ASGI o corpo é um
+iterador assíncrono que busca cada lote numa thread (`sync_to_async`); um gerador
+síncrono seria consumido inteiro para a memória pelo Django antes do envio.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+TAMANHO_DO_LOTE = 2000
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        itens = data if isinstance(data, list) else [data]
+        return "".join(json.dumps(item, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n" for item in itens)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        itens = data if isinstance(data, list) else [data]
+        return "".join(_linhas_csv(itens))
+
+
+class _Eco:
+    """Destino do csv.writer que devolve a linha em vez de gravá-la."""
+
+    def write(self, valor):
+        return valor
+
+
+def _celula(valor):
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return valor
+
+
+def _linhas_csv(itens):
+    escritor = csv.writer(_Eco())
+    colunas = None
+    for item in itens:
+        if colunas is None:
+            colunas = list(item)
+            yield escritor.writerow(colunas)
+        yield escritor.writerow([_celula(item.get(coluna)) for coluna in colunas])
+
+
+def _linhas_ndjson(itens):
+    for item in itens:
+        yield json.dumps(item, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+async def _em_lotes(linhas):
+    # thread_sensitive: todos os lotes na mesma thread, a do cursor aberto pelo .iterator()
+    proximo_lote = sync_to_async(lambda: "".join(islice(linhas, TAMANHO_DO_LOTE)), thread_sensitive=True)
+    while True:
+        lote = await proximo_lote()
+        if not lote:
+            return
+        yield lote
+
+
+FORMATOS = ("ndjson", "csv")
+RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer, CSVRenderer]
+
+
+class ExportacaoMixin:
+    """`list` com ?format=ndjson|csv devolve a listagem inteira em streaming, sem paginação."""
+
+    renderer_classes = RENDERERS
+
+    def formato_de_exportacao(self):
+        formato = getattr(self.request.accepted_renderer, "format", None)
+        return formato if formato in FORMATOS else None
+
+    def exportar(self, queryset, formato):
+        serializer = self.get_serializer()
+        itens = (serializer.to_representation(objeto) for objeto in queryset.iterator(chunk_size=TAMANHO_DO_LOTE))
+        if formato == "csv":
+            linhas, tipo = _linhas_csv(itens), "text/csv; charset=utf-8"
+        else:
+            linhas, tipo = _linhas_ndjson(itens), "application/x-ndjson"
+        if isinstance(self.request._request, ASGIRequest):
+            linhas = _em_lotes(linhas)
+        resposta = StreamingHttpResponse(linhas, content_type=tipo)
+        nome = getattr(self, "basename", None) or "exportacao"
+        resposta["Content-Disposition"] = f'attachment; filename="{nome}.{formato}"'
+        return resposta
+
+    def list(self, request, *args, **kwargs):
+        formato = self.formato_de_exportacao()
+        if formato is None:
+            return super().list(request, *args, **kwargs)
+        return self.exportar(self.filter_queryset(self.get_queryset()), formato)
@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CursorPorIdPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) na chave primária: cada página é um
+    `WHERE id < ...` sobre o índice, sem OFFSET nem COUNT(*).
+    """
+    ordering = "-id"
+    page_size = 25
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class CursorPorNumeroPagination(CursorPorIdPagination):
+    """Números de um sorteio em ordem, pelo índice único (sorteio, numero)."""
+    ordering = "numero"
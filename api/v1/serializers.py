@@ -1,10 +1,38 @@
 from rest_framework import serializers
 from api.models import (
-    User, SiteConfig, Sorteio, SorteioNumero,
+    User, SiteConfig, Sorteio, SorteioNumero, SorteioApuracao,
     Comprar, Raspadinha
 )
 
 
+def _lista_de_parametro(valor):
+    return {item.strip() for item in (valor or "").split(",") if item.strip()}
+
+
+class CamposDinamicosMixin:
+    """
+    `?fields=id,status` devolve só esses campos e `?expand=comprar` aninha as relações
+    de `Meta.expansiveis`, que por padrão saem só com o id. Só vale no serializer raiz
+    (o que recebe o request no contexto) e só em leituras.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self._context.get("request")
+        if request is None or request.method not in ("GET", "HEAD"):
+            return
+
+        expandir = _lista_de_parametro(request.query_params.get("expand"))
+        for nome, serializer_class in getattr(self.Meta, "expansiveis", {}).items():
+            if nome in expandir and nome in self.fields:
+                self.fields[nome] = serializer_class(read_only=True)
+
+        pedidos = _lista_de_parametro(request.query_params.get("fields"))
+        if pedidos:
+            for nome in set(self.fields) - pedidos:
+                self.fields.pop(nome)
+
+
 # --------------------------
 # User Serializer
 # --------------------------
@@ -43,48 +71,114 @@ class SorteioNumeroSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "status", "proprietario"]
 
 
-class SorteioSerializer(serializers.ModelSerializer):
+class SorteioNumeroResumoSerializer(serializers.ModelSerializer):
+    """Só número e status, para a listagem paginada de números de um sorteio."""
+    class Meta:
+        model = SorteioNumero
+        fields = ["numero", "status"]
+
+
+class ContagensMixin(serializers.Serializer):
+    contagens = serializers.SerializerMethodField()
+
+    def get_contagens(self, obj):
+        return {
+            "disponiveis": obj.qtd_disponiveis,
+            "reservados": obj.qtd_reservados,
+            "vendidos": obj.qtd_vendidos,
+            "vencedores": obj.qtd_vencedores,
+        }
+
+
+class SorteioResumoSerializer(serializers.ModelSerializer):
+    """Representação mínima, usada quando o sorteio aparece dentro de outro objeto."""
+    class Meta:
+        model = Sorteio
+        fields = ["id", "titulo", "status", "numeros_totais", "preco_por_numero", "image"]
+
+
+class SorteioListSerializer(ContagensMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Sorteio
+        fields = [
+            "id", "titulo", "status", "numeros_totais", "preco_por_numero",
+            "comeca_as", "termina_em", "image", "contagens"
+        ]
+
+
+class SorteioSerializer(ContagensMixin, serializers.ModelSerializer):
     criado_por = UserSerializer(read_only=True)
-    numeros = SorteioNumeroSerializer(many=True, read_only=True)
 
     class Meta:
         model = Sorteio
         fields = [
             "id", "titulo", "descricao", "numeros_totais",
-            "preco_por_numero", "status", "comeca_as", "termina_em",
-            "image", "regras", "criado_por", "criado_em", "numeros"
+            "preco_por_numero", "status", "modo_alocacao", "comeca_as", "termina_em",
+            "image", "regras", "criado_por", "criado_em", "contagens", "hash_semente"
         ]
-        read_only_fields = ["id", "criado_em", "status", "criado_por"]
+        read_only_fields = ["id", "criado_em", "status", "criado_por", "hash_semente"]
+
+
+class SorteioApuracaoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SorteioApuracao
+        fields = ["sorteio", "semente", "hash_mapa", "total_vendidos", "faixas", "vencedores", "realizado_em"]
+        read_only_fields = fields
+
+
+class FaixaDePremioSerializer(serializers.Serializer):
+    nome = serializers.CharField(max_length=100)
+    quantidade = serializers.IntegerField(min_value=1)
+
+
+class ApurarSerializer(serializers.Serializer):
+    faixas = FaixaDePremioSerializer(many=True, required=False)
 
 
 # --------------------------
 # Compra (Comprar)
 # --------------------------
-class ComprarSerializer(serializers.ModelSerializer):
+class ComprarSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    sorteio = SorteioSerializer(read_only=True)
+    sorteio = SorteioResumoSerializer(read_only=True)
+    sorteio_id = serializers.PrimaryKeyRelatedField(
+        queryset=Sorteio.objects.all(), source="sorteio", write_only=True
+    )
 
     class Meta:
         model = Comprar
         fields = [
-            "id", "chave_idempotencia", "user", "sorteio",
+            "id", "chave_idempotencia", "user", "sorteio", "sorteio_id",
             "quantidade", "preco_unitario", "total_preco",
             "status", "provedor_de_pagamento", "pagamento_ref",
             "criado_em", "pago_em", "números_escolhidos"
         ]
-        read_only_fields = ["id", "chave_idempotencia", "criado_em", "pago_em"]
+        read_only_fields = [
+            "id", "chave_idempotencia", "criado_em", "pago_em",
+            "preco_unitario", "total_preco", "status",
+            "pagamento_ref", "números_escolhidos"
+        ]
+
+    def get_fields(self):
+        campos = super().get_fields()
+        if self.instance is not None:
+            # sorteio e quantidade são os do checkout: a reserva e o preço saíram deles
+            campos.pop("sorteio_id", None)
+            campos["quantidade"].read_only = True
+        return campos
 
 
 # --------------------------
 # Raspadinha
 # --------------------------
-class RaspadinhaSerializer(serializers.ModelSerializer):
+class RaspadinhaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    sorteio = SorteioSerializer(read_only=True)
-    comprar = ComprarSerializer(read_only=True)
+    sorteio = SorteioResumoSerializer(read_only=True)
+    comprar = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Raspadinha
+        expansiveis = {"comprar": ComprarSerializer}
         fields = [
             "id", "user", "sorteio", "comprar",
             "codigo", "status", "valor_premio",
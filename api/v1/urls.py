@@ -1,7 +1,14 @@
 from django.urls import include, path
 from ..routers import router
+from . import assincrono
+from .eventos import eventos_do_sorteio
 
 
 urlpatterns = [
+    path('async/sorteios/', assincrono.sorteios, name='async-sorteios'),
+    path('async/sorteios/<int:pk>/', assincrono.sorteio, name='async-sorteio'),
+    path('async/sorteios/<int:pk>/mapa/', assincrono.mapa, name='async-sorteio-mapa'),
+    path('async/me/numeros/', assincrono.numeros_do_usuario, name='async-meus-numeros'),
+    path('sorteios/<int:pk>/eventos/', eventos_do_sorteio, name='sorteio-eventos'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
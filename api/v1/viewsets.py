@@ -1,18 +1,78 @@
-from rest_framework import viewsets, permissions
+import gzip
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework import viewsets, permissions, serializers, status
+from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 from api.models import (
-    User, SiteConfig, Sorteio, SorteioNumero,
+    User, SiteConfig, Sorteio, SorteioNumero, SorteioApuracao,
     Comprar, Raspadinha
 )
 from .serializers import (
-    UserSerializer, SiteConfigSerializer, SorteioSerializer,
-    SorteioNumeroSerializer, ComprarSerializer, RaspadinhaSerializer
+    UserSerializer, SiteConfigSerializer, SorteioSerializer, SorteioListSerializer,
+    SorteioNumeroSerializer, SorteioNumeroResumoSerializer, ComprarSerializer, RaspadinhaSerializer,
+    SorteioApuracaoSerializer, ApurarSerializer
 )
+from .exportacao import RENDERERS, ExportacaoMixin
+from .paginacao import CursorPorIdPagination, CursorPorNumeroPagination
+from api.instrumentacao import InstrumentadoMixin, estatisticas
+from api.roteamento import LeituraEmReplicaMixin, no_principal
+from api.services import cache_sorteios, idempotencia, meus_numeros
+from api.services.agenda import vendas_abertas
+from api.services.apuracao import ApuracaoInvalida, apurar
+from api.services.estoque import CODIGO_PARA_STATUS, codificar_rle, mapa_completo, versao_do_mapa
+from api.services.pagamentos import ReferenciaInvalida, aplicar_pagamentos, vincular_referencia
+from api.services.reservas import ReservaExpirada, cancelar_reserva, confirmar_reserva, liberar_compras
+
+
+def relacoes_usadas(serializer, prefixo=""):
+    """
+    Caminhos para select_related/prefetch_related a partir dos campos que o
+    serializer vai de fato renderizar (já considerando ?fields= e ?expand=).
+    """
+    select, prefetch = [], []
+    for campo in serializer.fields.values():
+        if campo.write_only or campo.source == "*":
+            continue
+        caminho = prefixo + "__".join(campo.source_attrs)
+        if isinstance(campo, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            prefetch.append(caminho)
+            filho = getattr(campo, "child", None)
+            if isinstance(filho, serializers.BaseSerializer):
+                sub_select, sub_prefetch = relacoes_usadas(filho, caminho + "__")
+                prefetch.extend(sub_select + sub_prefetch)
+        elif isinstance(campo, serializers.BaseSerializer):
+            select.append(caminho)
+            sub_select, sub_prefetch = relacoes_usadas(campo, caminho + "__")
+            select.extend(sub_select)
+            prefetch.extend(sub_prefetch)
+        elif len(campo.source_attrs) > 1:
+            # ex.: source="sorteio.titulo"
+            select.append(prefixo + "__".join(campo.source_attrs[:-1]))
+    return select, prefetch
+
+
+class OtimizaConsultaMixin:
+    """Aplica select_related/prefetch_related conforme os campos aninhados do serializer."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        select, prefetch = relacoes_usadas(serializer)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
 
 
 # --------------------------
 # Usuários
 # --------------------------
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(InstrumentadoMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -21,7 +81,7 @@ class UserViewSet(viewsets.ModelViewSet):
 # --------------------------
 # Configuração do Site
 # --------------------------
-class SiteConfigViewSet(viewsets.ModelViewSet):
+class SiteConfigViewSet(InstrumentadoMixin, viewsets.ModelViewSet):
     queryset = SiteConfig.objects.all()
     serializer_class = SiteConfigSerializer
     permission_classes = [permissions.IsAdminUser]
@@ -30,19 +90,148 @@ class SiteConfigViewSet(viewsets.ModelViewSet):
 # --------------------------
 # Sorteio + Números
 # --------------------------
-class SorteioViewSet(viewsets.ModelViewSet):
-    queryset = Sorteio.objects.all()
+class SorteioViewSet(InstrumentadoMixin, LeituraEmReplicaMixin, ExportacaoMixin, viewsets.ModelViewSet):
+    queryset = Sorteio.objects.order_by("-criado_em")
     serializer_class = SorteioSerializer
     #permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        # contagens vêm dos contadores da própria linha do sorteio
+        queryset = super().get_queryset()
+        if self.action != "list":
+            queryset = queryset.select_related("criado_por")
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return SorteioListSerializer
+        if self.action == "numeros":
+            return SorteioNumeroResumoSerializer
+        return SorteioSerializer
+
     def perform_create(self, serializer):
         serializer.save(criado_por=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        if self.formato_de_exportacao():
+            return super().list(request, *args, **kwargs)
+        return self._resposta_em_cache(cache_sorteios.ESCOPO_LISTA, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs[self.lookup_field])
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        escopo = cache_sorteios.escopo_do_sorteio(int(pk))
+        return self._resposta_em_cache(escopo, super().retrieve, request, *args, **kwargs)
+
+    def _resposta_em_cache(self, escopo, gerar, request, *args, **kwargs):
+        """
+        JSON já renderizado, servido do cache enquanto a versão do escopo não muda
+        (services/cache_sorteios.py); responde 304 para If-None-Match da versão atual.
+        """
+        if not cache_sorteios.ativo():
+            return gerar(request, *args, **kwargs)
+        variante = cache_sorteios.variante(request.META.get("QUERY_STRING", ""))
+        versao = cache_sorteios.versao(escopo)
+        etag = f'W/"{escopo}-{versao}-{variante}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            resposta = HttpResponseNotModified()
+            resposta["ETag"] = etag
+            return resposta
+
+        nao_cacheada = []
 
-class SorteioNumeroViewSet(viewsets.ModelViewSet):
-    queryset = SorteioNumero.objects.all()
+        def calcular():
+            # a versão nova pode ainda não ter chegado à réplica; o que for calculado
+            # aqui fica no cache sob ela, então a leitura vai ao principal
+            with no_principal():
+                resposta = gerar(request, *args, **kwargs)
+            if resposta.status_code != status.HTTP_200_OK:
+                nao_cacheada.append(resposta)
+                return None
+            return JSONRenderer().render(resposta.data)
+
+        versao, payload = cache_sorteios.obter(escopo, versao, variante, calcular)
+        if payload is None:
+            return nao_cacheada[0]
+        resposta = HttpResponse(payload, content_type="application/json")
+        resposta["ETag"] = f'W/"{escopo}-{versao}-{variante}"'
+        return resposta
+
+    @action(detail=True, methods=["get"], renderer_classes=RENDERERS)
+    def numeros(self, request, pk=None):
+        """
+        Números já reservados/vendidos do sorteio, paginados por cursor ou exportados
+        inteiros com ?format=ndjson|csv. Aceita ?status=.
+        """
+        sorteio = self.get_object()
+        numeros = SorteioNumero.objects.filter(sorteio=sorteio).only("numero", "status")
+        if request.query_params.get("status"):
+            numeros = numeros.filter(status=request.query_params["status"])
+        formato = self.formato_de_exportacao()
+        if formato is not None:
+            return self.exportar(numeros.order_by("numero"), formato)
+        paginador = CursorPorNumeroPagination()
+        page = paginador.paginate_queryset(numeros, request, view=self)
+        return paginador.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=True, methods=["get"])
+    def mapa(self, request, pk=None):
+        """
+        Status de todos os números do sorteio, um byte por número (application/octet-stream,
+        comprimido com gzip quando o cliente aceita) ou `?formato=rle` em JSON.
+        Responde 304 enquanto nada mudar no sorteio (ETag/If-None-Match).
+        """
+        sorteio_id = self.get_object().pk
+        formato = request.query_params.get("formato", "binario")
+        etag = f'W/"{sorteio_id}-{versao_do_mapa(sorteio_id) or 0}-{formato}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            resposta = HttpResponseNotModified()
+            resposta["ETag"] = etag
+            return resposta
+
+        mapa = mapa_completo(sorteio_id)
+        if formato == "rle":
+            resposta = Response({
+                "codigos": {codigo: status for codigo, status in CODIGO_PARA_STATUS.items()},
+                "sequencias": codificar_rle(mapa),
+            })
+        else:
+            resposta = HttpResponse(content_type="application/octet-stream")
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                mapa = gzip.compress(mapa, compresslevel=6)
+                resposta["Content-Encoding"] = "gzip"
+            resposta.content = mapa
+            resposta["Vary"] = "Accept-Encoding"
+        resposta["ETag"] = etag
+        return resposta
+
+    @action(detail=True, methods=["post"], permission_classes=[permissions.IsAdminUser])
+    def apurar(self, request, pk=None):
+        """Fecha as vendas e sorteia os vencedores. Corpo opcional: {"faixas": [{nome, quantidade}]}."""
+        entrada = ApurarSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        try:
+            apuracao = apurar(self.get_object(), faixas=entrada.validated_data.get("faixas"))
+        except ApuracaoInvalida as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(SorteioApuracaoSerializer(apuracao).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["get"])
+    def resultado(self, request, pk=None):
+        """Vencedores, semente e hash do mapa para conferência pública."""
+        sorteio = self.get_object()
+        apuracao = SorteioApuracao.objects.filter(sorteio=sorteio).first()
+        if apuracao is None:
+            return Response({"detail": "Sorteio ainda não apurado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(SorteioApuracaoSerializer(apuracao).data)
+
+
+class SorteioNumeroViewSet(InstrumentadoMixin, ExportacaoMixin, viewsets.ModelViewSet):
+    queryset = SorteioNumero.objects.order_by("-id")
     serializer_class = SorteioNumeroSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CursorPorIdPagination
 
     def perform_create(self, serializer):
         serializer.save(proprietario=self.request.user)
@@ -51,22 +240,185 @@ class SorteioNumeroViewSet(viewsets.ModelViewSet):
 # --------------------------
 # Comprar
 # --------------------------
-class ComprarViewSet(viewsets.ModelViewSet):
-    queryset = Comprar.objects.all()
+class ComprarViewSet(InstrumentadoMixin, OtimizaConsultaMixin, ExportacaoMixin, viewsets.ModelViewSet):
+    queryset = Comprar.objects.order_by("-id")
     serializer_class = ComprarSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CursorPorIdPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    def get_permissions(self):
+        # o comprador só cria, consulta e desiste (ação `cancelar`, que devolve os números
+        # ao estoque); a reserva e o preço dependem do pedido como estava no checkout
+        if self.action in ("update", "partial_update", "destroy"):
+            return [permissions.IsAdminUser()]
+        return super().get_permissions()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            liberar_compras([instance.pk])
+            instance.delete()
+
+    def create(self, request, *args, **kwargs):
+        """Com o header Idempotency-Key, repetições do mesmo POST devolvem a resposta original."""
+        if "Idempotency-Key" not in request.headers:
+            return self._recusar_se_fechado(request) or super().create(request, *args, **kwargs)
+        try:
+            chave = idempotencia.ler_chave(request.headers["Idempotency-Key"])
+        except idempotencia.ChaveInvalida as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        impressao = idempotencia.impressao(request.data.get("sorteio_id"), request.data.get("quantidade"))
+
+        salva = idempotencia.resposta_salva(request.user.pk, chave)
+        if salva is None:
+            # cache expirado (ou de outro processo): a compra já gravada responde antes de
+            # qualquer validação, senão a repetição seria recusada se o sorteio fechou
+            salva = self._resposta_da_compra_existente(chave)
+            if salva is not None:
+                idempotencia.salvar_resposta(request.user.pk, chave, *salva)
+        if salva is None:
+            fechado = self._recusar_se_fechado(request)
+            if fechado is not None:
+                return fechado
+            try:
+                self.chave_idempotencia = chave
+                resposta = super().create(request, *args, **kwargs)
+            except IntegrityError:
+                # corrida: outra requisição com a mesma chave gravou entre a busca e o INSERT
+                resposta = None
+            if resposta is not None:
+                idempotencia.salvar_resposta(request.user.pk, chave, impressao, resposta.status_code, resposta.data)
+                return resposta
+            salva = self._resposta_da_compra_existente(chave)
+            if salva is None:
+                return Response({"detail": "Idempotency-Key já usada."}, status=status.HTTP_409_CONFLICT)
+            idempotencia.salvar_resposta(request.user.pk, chave, *salva)
+
+        impressao_original, status_original, dados = salva
+        if impressao_original != impressao:
+            return Response(
+                {"detail": "Idempotency-Key já usada com outro pedido."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(dados, status=status_original, headers={"Idempotent-Replayed": "true"})
+
+    def _recusar_se_fechado(self, request):
+        # status vindo do cache (services/agenda.py): sorteio fechado é recusado sem ler o banco;
+        # ids inválidos ou desconhecidos seguem para a validação do serializer
+        sorteio_id = str(request.data.get("sorteio_id", ""))
+        if not sorteio_id.isdigit() or vendas_abertas(int(sorteio_id)) is not False:
+            return None
+        return Response({"sorteio_id": ["As vendas deste sorteio não estão abertas."]}, status=status.HTTP_400_BAD_REQUEST)
+
+    def _resposta_da_compra_existente(self, chave):
+        comprar = self.get_queryset().filter(chave_idempotencia=chave, user=self.request.user).first()
+        if comprar is None:
+            return None
+        dados = self.get_serializer(comprar).data
+        return idempotencia.impressao(comprar.sorteio_id, comprar.quantidade), status.HTTP_201_CREATED, dados
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        sorteio = serializer.validated_data["sorteio"]
+        quantidade = serializer.validated_data["quantidade"]
+        if sorteio.status != Sorteio.Status.SELLING:
+            raise serializers.ValidationError({"sorteio_id": "As vendas deste sorteio não estão abertas."})
+        # recusa cedo pelo contador; a reserva de fato acontece no worker da fila
+        if quantidade > sorteio.qtd_disponiveis:
+            raise serializers.ValidationError({"quantidade": "Não há números suficientes disponíveis para esta compra."})
+        extras = {}
+        if getattr(self, "chave_idempotencia", None):
+            extras["chave_idempotencia"] = self.chave_idempotencia
+        # a compra e a tarefa que vai reservar os números entram juntas
+        with transaction.atomic():
+            serializer.save(
+                user=self.request.user,
+                preco_unitario=sorteio.preco_por_numero,
+                total_preco=sorteio.preco_por_numero * quantidade,
+                **extras,
+            )
+
+    @action(detail=True, methods=["post"], permission_classes=[permissions.IsAdminUser])
+    def confirmar_pagamento(self, request, pk=None):
+        """Webhook/admin: a reserva da compra vira venda."""
+        try:
+            comprar = confirmar_reserva(self.get_object(), pagamento_ref=request.data.get("pagamento_ref", ""))
+        except ReservaExpirada as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except IntegrityError:
+            return Response({"detail": "pagamento_ref já usado em outra compra."}, status=status.HTTP_409_CONFLICT)
+        return Response(ComprarSerializer(comprar).data)
+
+    @action(detail=True, methods=["post"], permission_classes=[permissions.IsAdminUser])
+    def vincular_pagamento(self, request, pk=None):
+        """Checkout/webhook: grava na compra pendente a referência devolvida pelo provedor."""
+        if not str(request.data.get("pagamento_ref") or "").strip():
+            return Response({"pagamento_ref": ["Este campo é obrigatório."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            comprar = vincular_referencia(
+                self.get_object(), request.data.get("pagamento_ref"), request.data.get("provedor_de_pagamento", ""),
+            )
+        except ReferenciaInvalida as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(ComprarSerializer(comprar).data)
+
+    @action(detail=False, methods=["post"], permission_classes=[permissions.IsAdminUser])
+    def pagamentos(self, request):
+        """
+        Webhook/conciliação em lote: lista de {pagamento_ref, status, pago_em}
+        (ou {"pagamentos": [...]}); devolve o resultado de cada item.
+        """
+        itens = request.data.get("pagamentos") if isinstance(request.data, dict) else request.data
+        if not isinstance(itens, list):
+            return Response({"detail": "Envie uma lista de pagamentos."}, status=status.HTTP_400_BAD_REQUEST)
+        resultados = list(aplicar_pagamentos(itens))
+        return Response({"resultados": resultados, "resumo": Counter(r["resultado"] for r in resultados)})
+
+    @action(detail=True, methods=["post"])
+    def cancelar(self, request, pk=None):
+        """Desiste de uma compra pendente e devolve os números ao estoque."""
+        if not cancelar_reserva(self.get_object()):
+            return Response({"detail": "Só compras pendentes podem ser canceladas."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 # --------------------------
 # Raspadinha
 # --------------------------
-class RaspadinhaViewSet(viewsets.ModelViewSet):
-    queryset = Raspadinha.objects.all()
+class RaspadinhaViewSet(InstrumentadoMixin, OtimizaConsultaMixin, ExportacaoMixin, viewsets.ModelViewSet):
+    queryset = Raspadinha.objects.order_by("-id")
     serializer_class = RaspadinhaSerializer
+    pagination_class = CursorPorIdPagination
     #permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+# --------------------------
+# Meus números
+# --------------------------
+class MeusNumerosViewSet(viewsets.ViewSet):
+    """Números do usuário logado por sorteio, em faixas [inicio, fim]. Aceita ?sorteio=."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        sorteio_id = request.query_params.get("sorteio")
+        if sorteio_id is not None and not sorteio_id.isdigit():
+            return Response({"sorteio": ["Informe o id do sorteio."]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(meus_numeros.numeros_do_usuario(request.user.pk, int(sorteio_id) if sorteio_id else None))
+
+
+# --------------------------
+# Métricas
+# --------------------------
+class MetricasViewSet(viewsets.ViewSet):
+    """Consultas SQL, tempos e tamanho de resposta por rota, somados neste processo."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        return Response(estatisticas())
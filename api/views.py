@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django.db import transaction
 from api.models import *
 from api.v1.serializers import *
+from api.services.config import obter_config
 #from .services import reveal_scratchcard  # onde você colocou o helper
 
 class IsAdmin(permissions.IsAdminUser):
@@ -103,8 +104,7 @@ class WithdrawalViewSet(mixins.CreateModelMixin,
         return WithdrawalRequest.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        cfg = SiteConfig.objects.first()
-        min_value = cfg.min_withdraw_amount if cfg else 0
+        min_value = obter_config().valor_min_de_saque
         if serializer.validated_data["amount"] < min_value:
             raise serializers.ValidationError(f"Valor mínimo de saque é {min_value}.")
         serializer.save(user=self.request.user)